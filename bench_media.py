@@ -0,0 +1,190 @@
+"""
+Бенчмарк функций постобработки медиа из render_math.py:
+crop_video, find_black_borders и crop_png (обрезка PNG по альфа-каналу).
+
+Тестовые файлы генерируются локально и детерминированно (ffmpeg lavfi, PIL),
+интернет и GPU не нужны. Результаты сравниваются с сохранённым базовым
+замером, замедление больше допуска считается регрессией.
+
+    python bench_media.py                 # замер и сравнение с базовым
+    python bench_media.py --save          # замер и сохранение базового
+    python bench_media.py --sizes 480p    # только одно разрешение
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+import render_math
+
+BENCH_DIR = Path("media/.cache/bench")            # Сгенерированные тестовые файлы
+BASELINE_FILE = Path("media/.cache/bench_baseline.json")
+
+SIZES = {
+    "480p": (854, 480),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+BORDERS = (64, 32, 96, 48)  # Известные чёрные поля: left, top, right, bottom
+DURATION = 2                # Секунд видео
+FPS = 30
+PNG_SIZE = (4000, 4000)     # Большой прозрачный PNG
+PNG_CONTENT = (1200, 900, 2800, 2500)  # Непрозрачный прямоугольник: left, upper, right, lower
+
+
+def make_video(name: str) -> Path:
+    """
+    Создаёт тестовое видео с известными чёрными полями (если его ещё нет).
+    """
+    width, height = SIZES[name]
+    left, top, right, bottom = BORDERS
+    path = BENCH_DIR / f"borders_{name}.mp4"
+    if path.is_file():
+        return path
+
+    BENCH_DIR.mkdir(parents=True, exist_ok=True)
+    content_w, content_h = width - left - right, height - top - bottom
+    cmd = [
+        'ffmpeg', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size={content_w}x{content_h}:rate={FPS}:duration={DURATION}',
+        # Белая рамка по краю контента, чтобы его границы были однозначны
+        '-vf', f'drawbox=x=0:y=0:w=iw:h=ih:color=white:t=4,pad={width}:{height}:{left}:{top}:black',
+        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-g', str(FPS),
+        '-y', str(path)
+    ]
+    subprocess.run(cmd, check=True)
+    return path
+
+
+def make_png() -> Path:
+    """
+    Создаёт большой прозрачный PNG с непрозрачным прямоугольником в известном месте.
+    """
+    path = BENCH_DIR / "alpha.png"
+    if path.is_file():
+        return path
+
+    BENCH_DIR.mkdir(parents=True, exist_ok=True)
+    img = Image.new("RGBA", PNG_SIZE, (0, 0, 0, 0))
+    img.paste((88, 196, 221, 255), PNG_CONTENT)
+    img.save(path)
+    return path
+
+
+def measure(func, repeat: int, setup=None) -> tuple:
+    """
+    Запускает func repeat раз. setup вызывается перед каждым запуском и в замер не входит.
+
+    Returns:
+        tuple: (медиана времени в секундах, результат последнего запуска)
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def bench_video(name: str, repeat: int) -> list[dict]:
+    path = make_video(name)
+    width, height = SIZES[name]
+    frames = DURATION * FPS
+    megapixels = width * height * frames / 1e6
+    results = []
+    # probe_video кэширует метаданные файла: без сброса ffprobe платил бы только первый повтор
+    fresh = render_math._probe_cache.clear
+
+    # find_black_borders: найденные поля должны совпасть с известными (±2 пикселя на сжатие)
+    seconds, borders = measure(lambda: render_math.find_black_borders(str(path)), repeat, setup=fresh)
+    results.append({
+        "name": f"find_black_borders[{name}]",
+        "seconds": seconds,
+        "throughput": f"{megapixels / seconds:.1f} Мпикс/с",
+        "ok": all(abs(a - b) <= 2 for a, b in zip(borders, BORDERS)),
+        "detail": f"поля {borders}, ожидалось {list(BORDERS)}",
+    })
+
+    # crop_video: размер результата должен совпасть с размером контента
+    with tempfile.TemporaryDirectory() as work_dir:
+        source = Path(work_dir) / path.name
+        source.write_bytes(path.read_bytes())
+        seconds, output = measure(lambda: render_math.crop_video(str(source), BORDERS), repeat, setup=fresh)
+        expected = (width - BORDERS[0] - BORDERS[2], height - BORDERS[1] - BORDERS[3])
+        actual = tuple(render_math.probe_video(output)[k] for k in ("width", "height")) if output else None
+        results.append({
+            "name": f"crop_video[{name}]",
+            "seconds": seconds,
+            "throughput": f"{frames / seconds:.1f} кадр/с",
+            "ok": actual == expected,
+            "detail": f"размер {actual}, ожидалось {expected}",
+        })
+    return results
+
+
+def bench_png(repeat: int) -> list[dict]:
+    path = make_png()
+    padding = 20
+    with tempfile.TemporaryDirectory() as work_dir:
+        target = Path(work_dir) / "cropped.png"
+        seconds, bbox = measure(lambda: render_math.crop_png(path, target, padding=padding), repeat)
+        left, upper, right, lower = PNG_CONTENT
+        expected = (left - padding, upper - padding, right + padding, lower + padding)
+        return [{
+            "name": f"crop_png[{PNG_SIZE[0]}x{PNG_SIZE[1]}]",
+            "seconds": seconds,
+            "throughput": f"{PNG_SIZE[0] * PNG_SIZE[1] / 1e6 / seconds:.1f} Мпикс/с",
+            "ok": bbox == expected and Image.open(target).size == (expected[2] - expected[0], expected[3] - expected[1]),
+            "detail": f"рамка {bbox}, ожидалось {expected}",
+        }]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк постобработки медиа")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=3, help="повторов каждого замера (берётся медиана)")
+    parser.add_argument("--save", action="store_true", help="сохранить результаты как базовые")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимое замедление (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.sizes:
+        results += bench_video(name, args.repeat)
+    results += bench_png(args.repeat)
+
+    baseline = json.loads(BASELINE_FILE.read_text(encoding="utf-8")) if BASELINE_FILE.is_file() else {}
+    failed = False
+    print(render_math.ctext(f"{'Замер':<28} {'Время':>9} {'База':>9}  {'Пропускная способность':<24} Результат", "cyan", "bold"))
+    for result in results:
+        base = baseline.get(result["name"])
+        status = "ok"
+        color = "green"
+        if not result["ok"]:
+            status, color, failed = f"НЕВЕРНО: {result['detail']}", "red", True
+        elif base and result["seconds"] > base * (1 + args.tolerance):
+            status, color, failed = f"РЕГРЕССИЯ x{result['seconds'] / base:.2f}", "red", True
+        base_text = f"{base:.3f}" if base else "-"
+        print(render_math.ctext(
+            f"{result['name']:<28} {result['seconds']:>9.3f} {base_text:>9}  {result['throughput']:<24} {status}", color
+        ))
+
+    if args.save:
+        BASELINE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        BASELINE_FILE.write_text(
+            json.dumps({result["name"]: result["seconds"] for result in results}, indent=4), encoding="utf-8"
+        )
+        print(f"Базовые значения сохранены: {BASELINE_FILE}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
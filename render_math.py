@@ -1,39 +1,272 @@
-from manim import *  # type: ignore
 import os
-import shutil
-from PIL import Image
+import importlib
+import importlib.util
+import re
+import sys
+import json
+import argparse
 from pathlib import Path
 
-import subprocess
-import cv2
-import numpy as np
+import threading
+import time
+from contextlib import contextmanager
 
-# config.background_color = "#000000"
-config.media_dir = "./media"  # Явно указываем медиа директорию
+try:
+    import fcntl     # reflink и учёт ресурсов есть только в Unix
+    import resource
+except ImportError:
+    fcntl = resource = None
 
 
-class Formula(Scene):
-    def construct(self):
-        circle = Circle()  # создать обьект
-        circle.set_fill(BLUE, opacity=0.5)  # устаноить цвет и прозрачность
+class _LazyModule:
+    """
+    Модуль, который импортируется при первом обращении к его атрибуту.
+    Так numpy и PIL не замедляют запуск команд, которым они не нужны.
+    """
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
 
-        square = Square()
-        square.shift(2 * LEFT) # переместить
-        square.rotate(PI/4) # повернуть обьект
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
 
-        circle.next_to(square, RIGHT, buff=0.5)  # позиция справа от квадрата
 
-        self.play(Create(circle), Create(square))  # показать фигуры
-        self.play(square.animate.rotate(PI/4))  # анимация поворота
-        Wait(1) # пауза
-        self.play(Rotate(square, angle=PI)) # другая анимация поворота
+np = _LazyModule("numpy")
+Image = _LazyModule("PIL.Image")
 
-        
+MEDIA_DIR = Path("media")         # Медиа директория Manim по умолчанию
+SCENES_MODULE = "scenes"          # Модуль со сценами (сцены по имени ищутся в нём)
+CACHE_DIR = Path("media/.cache")  # Кэш готовых результатов рендеринга
+JOBS_DIR = Path("media/jobs")     # Отдельные медиа директории задач планировщика
+PREVIEW_DIR = Path("media/preview")  # Быстрые превью режима наблюдения (watch)
+TEX_CACHE_DIR = CACHE_DIR / "Tex"      # Общий кэш LaTeX (имена файлов - хэши формул)
+TEXT_CACHE_DIR = CACHE_DIR / "texts"   # Общий кэш SVG для Text
+TEX_CACHE_BUDGET = 500 * 1024 ** 2     # Предельный размер кэшей LaTeX/Text в байтах
+FORMULA_CACHE_DIR = CACHE_DIR / "formulas"  # PNG/SVG формул из render_formulas
+PARTIAL_CACHE_DIR = CACHE_DIR / "partial_movie_files"  # Отрезки self.play(...) по хэшу анимации
+PARTIAL_JOBS_DIR = CACHE_DIR / "partial_jobs"  # Отрезки выполняющихся рендеров (см. partial_movie_dir)
+PARTIAL_CACHE_BUDGET = 2 * 1024 ** 3   # Предельный размер кэша отрезков в байтах
+SPOOL_DIR = CACHE_DIR / "spool"        # Несжатые кадры до кодирования (см. _spool)
+OUTPUT_CACHE_BUDGET = 5 * 1024 ** 3    # Предельный размер кэша готовых результатов (media/.cache/<ключ>.*)
+FORMULA_CACHE_BUDGET = 200 * 1024 ** 2  # Предельный размер кэша формул render_formulas
+FFMPEG_THREADS = 0                # Потоков на один процесс ffmpeg (0 - автоматически)
+REPORT_FILE = CACHE_DIR / "reports.jsonl"  # Отчёты о времени этапов (по строке на задачу)
+REPORT_SUMMARY = False            # Печатать таблицу этапов после каждой задачи
+DAEMON_SOCKET = CACHE_DIR / "render.sock"  # Unix сокет демона рендеринга (см. serve)
+
+
+# Какая сцена (или формула LaTeX) создаёт какой файл, на который ссылаются .md документы
+# (путь относительно media/). Формулы: {"tex": r"a + b = b + a"}
+BUILD_TARGETS = {
+    "manim/anim1.mp4": {"scene": "Formula"},
+    "manim/anim2.mp4": {"scene": "TwoTransforms"},
+}
+
+
+def resolve_scene(scene):
+    """
+    Возвращает класс сцены. scene может быть классом, именем класса из
+    SCENES_MODULE или строкой 'модуль:Класс'. Manim импортируется только здесь.
+    """
+    if not isinstance(scene, str):
+        return scene
+    module_name, _, class_name = scene.rpartition(":")
+    return getattr(importlib.import_module(module_name or SCENES_MODULE), class_name)
+
+
+_stages = []  # Записи этапов текущей задачи (см. stage, write_report)
+_stage_listener = None  # Вызывается с записью каждого завершённого этапа (прогресс для демона)
+_open_stages = threading.local()  # Стек незавершённых этапов потока (для вычета вложенных)
+
+
+def _file_size(path) -> int:
+    return os.path.getsize(path) if path and os.path.isfile(path) else 0
+
+
+def _usage():
+    """
+    Процессорное время (своё + дочерних процессов) и пиковый RSS в МБ.
+    """
+    if resource is None:
+        return time.process_time(), 0.0
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    return cpu, max(own.ru_maxrss, children.ru_maxrss) / 1024  # ru_maxrss в КБ
+
+
+@contextmanager
+def stage(name: str, inputs=()):
+    """
+    Замеряет один этап конвейера: время, процессорное время (включая ffmpeg
+    и другие дочерние процессы), байты на входе и выходе, пиковый RSS.
+
+    Выходные файлы этапа добавляются в record["outputs"] внутри блока:
+
+        with stage("ffmpeg", inputs=[path]) as record:
+            ...
+            record["outputs"].append(output_path)
+
+    Время вложенных этапов (например, частей внутри manim_mp4) вычитается
+    из внешнего: в записи только собственное время этапа, поэтому сумма
+    по отчёту ничего не считает дважды. Уровень вложенности - в record["depth"].
+
+    Args:
+        name: название этапа
+        inputs: входные файлы этапа
+    """
+    record = {"stage": name, "outputs": []}
+    stack = _open_stages.__dict__.setdefault("stack", [])
+    nested = {"wall": 0.0, "cpu": 0.0}  # Сюда вложенные этапы добавляют своё полное время
+    stack.append(nested)
+    start_wall = time.perf_counter()
+    start_cpu, _ = _usage()
+    try:
+        yield record
+    finally:
+        cpu, peak_rss = _usage()
+        wall, cpu = time.perf_counter() - start_wall, cpu - start_cpu
+        stack.pop()
+        if stack:
+            stack[-1]["wall"] += wall
+            stack[-1]["cpu"] += cpu
+        outputs = record.pop("outputs")
+        record.update({
+            "depth": len(stack),
+            "wall": round(wall - nested["wall"], 4),
+            "cpu": round(cpu - nested["cpu"], 4),
+            "bytes_in": sum(_file_size(path) for path in inputs),
+            "bytes_out": sum(_file_size(path) for path in outputs),
+            "peak_rss_mb": round(peak_rss, 1),
+        })
+        _stages.append(record)
+        if _stage_listener is not None:
+            _stage_listener(record)
+
+
+def write_report(job: str, summary: bool = None) -> dict:
+    """
+    Дописывает отчёт по этапам задачи в REPORT_FILE (JSONL) и начинает новый.
+
+    Args:
+        job: имя задачи
+        summary: напечатать таблицу этапов (по умолчанию REPORT_SUMMARY)
+
+    Returns:
+        dict: отчёт {'job', 'time', 'wall', 'cpu', 'stages'}
+    """
+    from datetime import datetime
+
+    report = {
+        "job": job,
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "wall": round(sum(record["wall"] for record in _stages), 4),
+        "cpu": round(sum(record["cpu"] for record in _stages), 4),
+        "stages": list(_stages),
+    }
+    _stages.clear()
+    REPORT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(REPORT_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+    if REPORT_SUMMARY if summary is None else summary:
+        print(ctext(f"Этапы {job}:", "cyan", "bold"))
+        for record in report["stages"]:
+            name = "  " * record["depth"] + record["stage"]
+            print(f"  {name:<16} {record['wall']:>8.3f} с  CPU {record['cpu']:>8.3f} с  "
+                  f"{record['bytes_in'] / 1024:>9.0f} КБ -> {record['bytes_out'] / 1024:>9.0f} КБ  "
+                  f"RSS {record['peak_rss_mb']:.0f} МБ")
+        print(ctext(f"  Всего: {report['wall']:.3f} с, CPU {report['cpu']:.3f} с", "cyan"))
+    return report
+
+
+_probe_cache = {}  # (путь, размер, mtime) -> метаданные видео
+
+
+def _probe_key(path) -> tuple:
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+def probe_video(path) -> dict:
+    """
+    Читает метаданные видеопотока одним вызовом ffprobe.
+
+    Результат кэшируется по (путь, размер, mtime), поэтому повторные
+    вызовы для неизменённого файла не запускают ffprobe.
+
+    Args:
+        path: путь к видеофайлу
+
+    Returns:
+        dict: {'width', 'height', 'frames', 'fps', 'codec', 'duration'}
+    """
+    import subprocess
+
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Файл {path} не найден")
+    key = _probe_key(path)
+    if key in _probe_cache:
+        return _probe_cache[key]
+
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height,nb_frames,avg_frame_rate,codec_name,duration:format=duration',
+        '-of', 'json',
+        str(path)
+    ]
+    with stage("ffprobe", inputs=[path]):
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    data = json.loads(result.stdout)
+    stream = data["streams"][0]
+
+    num, _, den = stream.get("avg_frame_rate", "0/1").partition("/")
+    fps = float(num) / float(den or 1) if float(den or 1) else 0.0
+    duration = float(stream.get("duration") or data.get("format", {}).get("duration") or 0)
+    frames = int(stream["nb_frames"]) if stream.get("nb_frames", "N/A").isdigit() else round(duration * fps)
+
+    info = {
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+        "frames": frames,
+        "fps": fps,
+        "codec": stream.get("codec_name"),
+        "duration": duration,
+    }
+    _probe_cache[key] = info
+    return info
+
+
+def probe_videos(paths, workers: int = 8) -> dict:
+    """
+    Пакетная версия probe_video: ffprobe запускается параллельно для всех
+    ещё не прочитанных файлов.
+
+    Returns:
+        dict: {путь: метаданные}
+    """
+    paths = [str(path) for path in paths]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(probe_video, paths)))
 
 
+# Настройки кодировщика для crop_video: имя -> аргументы ffmpeg
+ENCODER_PRESETS = {
+    "default": [],                                                              # libx264 по умолчанию
+    "fast": ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23'],           # Быстро, файл крупнее
+    "animation": ['-c:v', 'libx264', '-preset', 'medium', '-crf', '20', '-tune', 'animation'],
+    "small": ['-c:v', 'libx264', '-preset', 'slow', '-crf', '26', '-tune', 'animation'],  # Меньше размер
+    "lossless": ['-c:v', 'libx264', '-preset', 'ultrafast', '-qp', '0'],        # Промежуточные файлы без потерь
+}
 
 
-def crop_video(input_path, size, crop_mode='center', replace_original=False):
+def crop_video(input_path, size, crop_mode='center', replace_original=False, encoder='default', threads=None,
+               log=print):
     """
     Обрезает видео до указанных размеров с использованием FFmpeg.
     
@@ -45,14 +278,14 @@ def crop_video(input_path, size, crop_mode='center', replace_original=False):
         crop_mode (str): Режим обрезки ('center', 'top_left', 'top_right', 'bottom_left', 'bottom_right')
                         Используется только при size=(width, height)
         replace_original (bool): Заменять ли оригинальное видео (True) или создать копию (False)
+        encoder: Имя из ENCODER_PRESETS или список аргументов ffmpeg для кодировщика
+        threads (int): Потоков ffmpeg (по умолчанию FFMPEG_THREADS)
+        log: куда писать сообщения (crop_videos собирает их и печатает из главного потока)
     
     Returns:
         str: Путь к обработанному видеофайлу
     """
-    
-    # Проверяем существование файла
-    if not os.path.isfile(input_path):
-        raise FileNotFoundError(f"Файл {input_path} не найден")
+    import subprocess
     
     # Проверяем формат size
     if len(size) == 2:
@@ -66,27 +299,21 @@ def crop_video(input_path, size, crop_mode='center', replace_original=False):
     else:
         raise ValueError("size должен быть tuple (width, height) или (left, top, right, bottom)")
     
-    # Получаем информацию о видео
+    # Получаем информацию о видео (проверяет и существование файла)
     try:
-        cmd_info = [
-            'ffprobe', 
-            '-v', 'error',
-            '-select_streams', 'v:0',
-            '-show_entries', 'stream=width,height',
-            '-of', 'csv=p=0',
-            input_path
-        ]
-        result = subprocess.run(cmd_info, capture_output=True, text=True, check=True)
-        orig_width, orig_height = map(int, result.stdout.strip().split(','))
+        info = probe_video(input_path)
+        orig_width, orig_height = info["width"], info["height"]
+    except FileNotFoundError:
+        raise
     except Exception as e:
         raise ValueError(f"Не удалось получить информацию о видео: {e}")
     
-    print(f"Исходный размер: {orig_width}x{orig_height}")
+    log(f"Исходный размер: {orig_width}x{orig_height}")
     
     # Вычисляем параметры обрезки в зависимости от режима
     if mode == 'dimensions':
         # Режим (width, height)
-        print(f"Целевой размер: {width}x{height}")
+        log(f"Целевой размер: {width}x{height}")
         
         # Проверяем размеры
         if width > orig_width or height > orig_height:
@@ -112,12 +339,12 @@ def crop_video(input_path, size, crop_mode='center', replace_original=False):
             raise ValueError("Неверный режим обрезки. Допустимые значения: 'center', 'top_left', 'top_right', 'bottom_left', 'bottom_right'")
         
         crop_filter = f"crop={width}:{height}:{x}:{y}"
-        print(f"Режим обрезки: {crop_mode}")
-        print(f"Координаты обрезки: x={x}, y={y}")
+        log(f"Режим обрезки: {crop_mode}")
+        log(f"Координаты обрезки: x={x}, y={y}")
         
     else:
         # Режим (left, top, right, bottom)
-        print(f"Отступы: left: {left}, top: {top}, right: {right}, bottom: {bottom}")
+        log(f"Отступы: left: {left}, top: {top}, right: {right}, bottom: {bottom}")
         
         # Вычисляем ширину и высоту обрезанного видео
         width = orig_width - left - right
@@ -134,7 +361,7 @@ def crop_video(input_path, size, crop_mode='center', replace_original=False):
             raise ValueError(f"Результирующий размер ({width}x{height}) больше исходного ({orig_width}x{orig_height})")
         
         crop_filter = f"crop={width}:{height}:{left}:{top}"
-        print(f"Результирующий размер: {width}x{height}")
+        log(f"Результирующий размер: {width}x{height}")
     
     # Определяем выходной путь
     if replace_original:
@@ -146,79 +373,245 @@ def crop_video(input_path, size, crop_mode='center', replace_original=False):
         temp_path = output_path
     
     # Строим команду FFmpeg
+    encoder_args = ENCODER_PRESETS[encoder] if isinstance(encoder, str) else list(encoder)
+    threads = FFMPEG_THREADS if threads is None else threads
     cmd = [
         'ffmpeg',
         '-i', input_path,           # Входной файл
         '-vf', crop_filter,         # Фильтр обрезки
+        *encoder_args,              # Настройки кодировщика
         '-c:a', 'copy',             # Копируем аудио без перекодирования
         '-y',                       # Перезаписывать выходной файл
         temp_path
     ]
+    if threads:
+        cmd[1:1] = ['-threads', str(threads)]     # Потоки декодера
+        cmd[-1:-1] = ['-threads', str(threads)]   # Потоки кодировщика
     
-    print(f"Команда: {' '.join(cmd)}")
+    log(f"Команда: {' '.join(cmd)}")
     
     try:
         # Запускаем FFmpeg
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        with stage("ffmpeg_crop", inputs=[input_path]) as record:
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            record["outputs"].append(temp_path)
         
         # Если заменяем оригинал, перемещаем временный файл
         if replace_original:
             os.replace(temp_path, output_path)
         
-        print("✅ Видео успешно обрезано!")
-        print(f"📁 Результат сохранен в: {output_path}")
+        log("✅ Видео успешно обрезано!")
+        log(f"📁 Результат сохранен в: {output_path}")
         
         return output_path
         
     except subprocess.CalledProcessError as e:
-        print(f"❌ Ошибка FFmpeg: {e}")
-        print(f"Stderr: {e.stderr}")
+        log(f"❌ Ошибка FFmpeg: {e}")
+        log(f"Stderr: {e.stderr}")
         # Удаляем временный файл если он создался
         if os.path.exists(temp_path):
             os.remove(temp_path)
         return None
 
 
-def find_black_borders(video_path, sample_frames=10, threshold=10):
+def _crop_key(path, size, crop_mode, encoder) -> str:
+    """
+    Ключ обрезки: параметры обрезки и кодировщика + размер и mtime файла.
+    """
+    import hashlib
+
+    stat = os.stat(path)
+    return hashlib.sha256(
+        f"{list(size)}|{crop_mode}|{encoder}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8")
+    ).hexdigest()
+
+
+def crop_videos(source, size, crop_mode='center', replace_original=False, encoder='default',
+                workers: int = 0, threads: int = 2) -> list[dict]:
+    """
+    Обрезает все видео в папке (или по glob-шаблону) параллельно.
+
+    Файлы, уже обрезанные с теми же параметрами, пропускаются: после обрезки
+    запоминается ключ из параметров и размера/mtime файла (см. record_output).
+
+    Args:
+        source: папка (берутся *.mp4) или glob-шаблон, например 'media/manim/*.mp4'
+        size: как в crop_video
+        crop_mode: как в crop_video
+        replace_original: как в crop_video
+        encoder: имя из ENCODER_PRESETS или список аргументов ffmpeg
+        workers: число одновременных ffmpeg (0 - по числу ядер / threads)
+        threads: потоков на один ffmpeg
+
+    Returns:
+        list[dict]: {'path', 'status' ('ok', 'skipped', 'failed'), 'seconds'}
+    """
+    from glob import glob
+
+    source_path = Path(source)
+    if source_path.is_dir():
+        paths = sorted(source_path.glob("*.mp4"))
+    else:
+        paths = sorted(Path(path) for path in glob(str(source)))
+    paths = [path for path in paths if not path.stem.endswith("_cropped")]
+    if not workers:
+        workers = max(1, (os.cpu_count() or 1) // threads)
+
+    def crop_one(path: Path) -> tuple[dict, list]:
+        lines = []
+        input_path = str(path)
+        output_path = input_path if replace_original else str(path.with_name(f"{path.stem}_cropped{path.suffix}"))
+        key = _crop_key(input_path, size, crop_mode, encoder)
+        if os.path.isfile(output_path) and recorded_key(output_path) == key:
+            return {"path": input_path, "status": "skipped", "seconds": 0.0}, lines
+
+        start = time.perf_counter()
+        result = crop_video(input_path, size, crop_mode, replace_original, encoder=encoder, threads=threads,
+                            log=lines.append)
+        seconds = time.perf_counter() - start
+        if result is None:
+            return {"path": input_path, "status": "failed", "seconds": seconds}, lines
+        if replace_original:
+            key = _crop_key(result, size, crop_mode, encoder)  # Ключ уже обрезанного файла
+        record_output(result, key)
+        return {"path": input_path, "status": "ok", "seconds": seconds}, lines
+
+    probes = probe_videos(paths)
+    start = time.perf_counter()
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(crop_one, path): path for path in paths}
+        # Сообщения файла печатаются целиком, когда он готов, а не вперемешку из потоков
+        for future in as_completed(futures):
+            result, lines = future.result()
+            if lines:
+                print(ctext(futures[future].name, "cyan"))
+                print("\n".join(lines))
+            results[futures[future]] = result
+    results = [results[path] for path in paths]
+    total = time.perf_counter() - start
+
+    done = [r for r in results if r["status"] == "ok"]
+    skipped = [r for r in results if r["status"] == "skipped"]
+    failed = [r for r in results if r["status"] == "failed"]
+    print(ctext(f"Обрезано: {len(done)}, пропущено: {len(skipped)}, ошибок: {len(failed)}, "
+                f"за {total:.1f} с ({workers} x {threads} потоков)", "cyan", "bold"))
+    if done and total:
+        print(ctext(f"Пропускная способность: {len(done) / total:.2f} файл/с, "
+                    f"{sum(probes[r['path']]['frames'] for r in done) / total:.0f} кадр/с", "cyan"))
+    for result in failed:
+        print(ctext(f"Ошибка: {result['path']}", "red"))
+    return results
+
+
+def _gray_frames(video_path, video_filter: str, width: int, height: int, batch: int = 16, seek=()):
+    """
+    Декодирует видео один раз через ffmpeg и отдаёт пачки кадров в оттенках серого.
+    seek - параметры ffmpeg перед -i (например, ['-sseof', '-1']).
+
+    Yields:
+        np.ndarray: массив (n, height, width) uint8
+    """
+    import subprocess
+
+    cmd = [
+        'ffmpeg',
+        '-v', 'error',
+        *seek,
+        '-i', str(video_path),
+        '-vf', f'{video_filter},format=gray',
+        '-vsync', '0',              # Не дублировать и не выкидывать кадры
+        '-f', 'rawvideo',
+        '-pix_fmt', 'gray',
+        '-'
+    ]
+    frame_size = width * height
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(frame_size * batch)
+            count = len(data) // frame_size
+            if count:
+                yield np.frombuffer(data[:count * frame_size], np.uint8).reshape(count, height, width)
+            if count < batch:
+                break
+    finally:
+        process.stdout.close()
+        process.wait()
+
+
+def _content_bbox(frames, threshold: float):
+    """
+    Общая рамка содержимого по всем кадрам (left, top, right, bottom), правая и нижняя границы не включаются.
+
+    Returns:
+        tuple | None: рамка и число кадров, либо None если содержимого нет
+    """
+    peak = None
+    count = 0
+    for batch in frames:
+        batch_max = batch.max(axis=0)
+        peak = batch_max if peak is None else np.maximum(peak, batch_max)
+        count += len(batch)
+    if peak is None:
+        return None, 0
+
+    mask = peak > threshold
+    cols = np.flatnonzero(mask.any(axis=0))
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not cols.size:
+        return None, count
+    return (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1), count
+
+
+def find_black_borders(video_path, sample_frames=0, threshold=10):
     """
     Определяет размер чёрных полей вокруг контента в видео.
-    
+
+    Видео декодируется один раз в полном разрешении в оттенках серого, и
+    рамка содержимого - общая для всех кадров (контент, появляющийся лишь
+    в части кадров, не обрезается). Каждый пиксель сравнивается с порогом
+    сам по себе, без усреднения, поэтому тонкие линии не теряются. Первая
+    пачка кадров просматривается целиком, а дальше - только полосы снаружи
+    уже найденной рамки: лишь там новый кадр может её расширить.
+
     Args:
         video_path (str): Путь к видеофайлу
-        sample_frames (int): Количество кадров для анализа
+        sample_frames (int): Сколько равномерно выбранных кадров просматривать (0 - все)
         threshold (int): Порог черного цвета (0-255)
-    
+
     Returns:
-        dict: {'left': int, 'top': int, 'right': int, 'bottom': int}
+        list: [left, top, right, bottom]
     """
-    cap = cv2.VideoCapture(video_path)
-    borders = []
-    
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    step = max(1, total_frames // sample_frames)
-    
-    for i in range(sample_frames):
-        cap.set(cv2.CAP_PROP_POS_FRAMES, i * step)
-        ret, frame = cap.read()
-        
-        if not ret:
+    info = probe_video(video_path)
+    width, height = info["width"], info["height"]
+    video_filter = "null"
+    if sample_frames and info["frames"] > sample_frames:
+        video_filter = f"select='not(mod(n\\,{info['frames'] // sample_frames}))'"
+
+    box = None
+    for batch in _gray_frames(video_path, video_filter, width, height):
+        if box is None:
+            box, _ = _content_bbox([batch], threshold)
             continue
-            
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # Находим границы контента
-        left = np.argmax(gray.max(axis=0) > threshold)
-        right = gray.shape[1] - np.argmax(gray.max(axis=0)[::-1] > threshold)
-        top = np.argmax(gray.max(axis=1) > threshold)
-        bottom = gray.shape[0] - np.argmax(gray.max(axis=1)[::-1] > threshold)
-        
-        borders.append((left, top, gray.shape[1] - right, gray.shape[0] - bottom))
-    
-    cap.release()
-    
-    # Усредняем результаты по всем кадрам
-    avg_borders = np.mean(borders, axis=0).astype(int)
-    return avg_borders.tolist()
+        left, top, right, bottom = box
+        strips = [
+            (0, 0, width, top), (0, bottom, width, height),           # Сверху и снизу во всю ширину
+            (0, top, left, bottom), (right, top, width, bottom),      # Слева и справа между ними
+        ]
+        for x0, y0, x1, y1 in strips:
+            if x1 <= x0 or y1 <= y0:
+                continue
+            found, _ = _content_bbox([batch[:, y0:y1, x0:x1]], threshold)
+            if found is not None:
+                box = (min(box[0], found[0] + x0), min(box[1], found[1] + y0),
+                       max(box[2], found[2] + x0), max(box[3], found[3] + y0))
+
+    if box is None:
+        return [0, 0, 0, 0]
+    left, top, right, bottom = box
+    return [left, top, width - right, height - bottom]
 
 
 def ctext(text, color: str = 'reset', style: str = 'reset') -> str:
@@ -278,152 +671,2263 @@ def ctext(text, color: str = 'reset', style: str = 'reset') -> str:
         return f"{styles[style]}{colors[color] if color != 'reset' else ''}{str(text)}\033[0m"
 
 
-def createAnim(formula_name: str, outpath: str = "math", image_mode: bool = False, 
-         video_mode: bool = False, quality: str = "l"):
+def render_key(scene, mode: str, quality: str, crop=None) -> str:
     """
-    Основная функция рендеринга
-    
+    Вычисляет ключ кэша для одного результата рендеринга.
+
+    Ключ зависит от исходного кода сцены, версии manim, качества,
+    режима (png/mp4/transparent) и настроек обрезки, поэтому любое
+    изменение сцены даёт новый ключ.
+
     Args:
-        formula_name: название выходного файла
-        outpath: путь для сохранения результатов
-        image_mode: рендерить ли изображение
-        video_mode: рендерить ли видео
-        quality: качество рендеринга ('l' - low, 'm' - medium, 'h' - high, 'p' - production)
+        scene: класс сцены Manim
+        mode: режим рендеринга ('png', 'mp4', 'transparent')
+        quality: качество рендеринга ('l', 'm', 'h', 'p')
+        crop: отступы обрезки (left, top, right, bottom), 'auto' или None
+
+    Returns:
+        str: hex-строка sha256
     """
-    # Получаем имя текущего скрипта
-    file_name = os.path.basename(__file__)
-    
-    # Создаем целевую директорию
-    target_dir = Path(outpath)
-    target_dir.mkdir(parents=True, exist_ok=True)
-    
-    image_mode = image_mode or not video_mode
-    print(f"Режимы - Изображение: {image_mode}, Видео: {video_mode}, Качество: {quality}")
+    import hashlib
+    import inspect
+    import manim
 
-    # Рендеринг изображения
-    if image_mode:
-        print("Рендеринг изображения...")
-        
-        # Команда для рендеринга PNG с прозрачным фоном
-        cmd = f"manim -q{quality} {file_name} Formula --format=png --transparent"
-        os.system(cmd)
-        
-        # Находим последний PNG
-        media_dir = Path(f"media/images/{file_name[:-3]}")
-        if media_dir.exists():
-            png_files = list(media_dir.glob("*.png"))
-            if png_files:
-                png_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-                last_png = png_files[0]
-                
-                # Обрезка по содержимому с отступом
-                img = Image.open(last_png)
-                alpha = img.split()[-1]
-                bbox = alpha.getbbox()
-                
-                if bbox:
-                    left, upper, right, lower = bbox
-                    # Добавляем отступ 20 пикселей
-                    padding = 20
-                    left = max(left - padding, 0)
-                    upper = max(upper - padding, 0)
-                    right = min(right + padding, img.width)
-                    lower = min(lower + padding, img.height)
-                    img_cropped = img.crop((left, upper, right, lower))
-                    
-                    # Сохраняем обрезанное изображение
-                    target_path = target_dir / f"{formula_name}.png"
-                    img_cropped.save(target_path)
-                    print(f"Изображение сохранено: {target_path}")
-    
-    # Рендеринг видео
-    if video_mode:
-        print("Рендеринг видео...")
-        
-        # Команда для рендеринга видео (без прозрачности, так как mp4 не поддерживает альфу)
-        cmd = f"manim -q{quality} {file_name} Formula --format=mp4"
-        os.system(cmd)
-        
-        # Находим последнее видео
-        media_dir = Path(f"media/videos/{file_name[:-3]}")
-        if media_dir.exists():
-            mp4_files = list(media_dir.glob("**/*.mp4"))
-            if mp4_files:
-                mp4_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-                last_mp4 = mp4_files[0]
-                
-                # Копируем в целевую директорию
-                target_mp4 = target_dir / f"{formula_name}.mp4"
-                shutil.copy2(last_mp4, target_mp4)
-                print(f"Видео сохранено: {target_mp4}")
+    if isinstance(crop, (list, tuple)):
+        crop = list(crop) if any(crop) else None
+    h = hashlib.sha256()
+    h.update(inspect.getsource(scene).encode("utf-8"))
+    h.update(f"|{manim.__version__}|{quality}|{mode}|{crop or None}".encode("utf-8"))
+    return h.hexdigest()
 
-                # Автоматическая обрезка
-                # cropped_mp4 = target_dir / f"{formula_name}_cropped.mp4"
-                # crop_video(target_mp4, cropped_mp4)
 
+def cache_lookup(key: str, suffix: str):
+    """
+    Ищет готовый результат в кэше.
 
-def cleanup():    
+    Returns:
+        Path | None: путь к файлу в кэше или None при промахе
+    """
+    cached = CACHE_DIR / f"{key}{suffix}"
+    return cached if cached.is_file() else None
+
+
+# Зацикленные анимации createAnim: формат -> расширение
+LOOP_FORMATS = {
+    "gif": ".gif",
+    "apng": ".apng",
+    "webp": ".webp",
+}
+
+
+def output_key(scene, suffix: str, quality: str, crop=None, max_bytes=None) -> str:
     """
-    Функция для очистки временных файлов, созданных Manim
+    Ключ кэша для выходного файла createAnim с расширением suffix ('.png', '.mp4', '.gif', '.apng', '.webp').
     """
-    # Очистка временных файлов
-    cleanup_dirs = ["videos", "images", "Tex", "texts"]
-    for dir_path in cleanup_dirs:
-        dir_path = Path(f"media/{dir_path}")
-        if dir_path.exists():
-            shutil.rmtree(dir_path)
-            print(f"Очищена директория: {dir_path}")
+    if suffix == ".png":
+        return render_key(scene, "transparent", quality)
+    for loop_format, loop_suffix in LOOP_FORMATS.items():
+        if suffix == loop_suffix:
+            return render_key(scene, f"{loop_format}:{max_bytes}", quality)
+    return render_key(scene, "mp4", quality, crop)
+
 
+def _stamp_path(target) -> Path:
+    import hashlib
 
-class Config:
-    # ╔═══════════════════════╗
-    # ║ Пути и имена файлов   ║
-    # ╚═══════════════════════╝
-    path = "media"              # Корневая папка для медиа
-    out_folder = "manim"        # Папка для текущего md файла
-    anim_name = "anim1"          # Имя анимации
+    return CACHE_DIR / "outputs" / hashlib.sha1(str(Path(target)).encode("utf-8")).hexdigest()
 
-    # ╔═══════════════════════╗
-    # ║ Режимы работы         ║
-    # ╚═══════════════════════╝
-    video_mode = True           # Рендерить видео
-    image_mode = False          # Рендерить одиночное изображение
-    quality = "h"               # Качество: l - low, m - medium, h - high, p - production
 
-    # ╔═══════════════════════╗
-    # ║ Обрезка видео         ║
-    # ╚═══════════════════════╝
-    crop = 0                 # Включить обрезку
-    offset = [0, 0, 0, 0]       # Смещение границ: left, top, right, bottom
-    sample_frames = 10          # Сколько кадров анализировать для поиска границ
+def record_output(target, key: str) -> None:
+    """
+    Запоминает, с каким ключом был опубликован файл target.
+    """
+    stamp = _stamp_path(target)
+    stamp.parent.mkdir(parents=True, exist_ok=True)
+    stamp.write_text(key, encoding="utf-8")
 
-    # ╔═══════════════════════╗
-    # ║ Отладка и очистка     ║
-    # ╚═══════════════════════╝
-    debug = False                # Включить режим отладки (не заменяет исходный файл)
-    clean = True                # Удалять временные файлы после рендеринга
 
+def recorded_key(target):
+    """
+    Returns:
+        str | None: ключ, с которым был опубликован target, или None
+    """
+    stamp = _stamp_path(target)
+    return stamp.read_text(encoding="utf-8") if stamp.is_file() else None
 
 
-if __name__ == "__main__":
-    config = Config()
-    final_path = f"{config.path}/{config.out_folder}/{config.anim_name}.mp4"
-    
-    # 1. Рендеринг, если файл не существует
-    if os.path.exists(final_path):
-        print(ctext("Анимация существует", "green", "bold"))
-    else:
-        createAnim(config.anim_name, outpath=f"{config.path}/{config.out_folder}", 
-             image_mode=config.image_mode, video_mode=config.video_mode, quality=config.quality)
-    
-    # 2. Обрезка видео
-    if config.crop:
-        # detected_borders = find_black_borders(final_path, sample_frames=config.sample_frames)
-        # crop_values = [a + b for a, b in zip(config.offset, detected_borders)]
-        crop_values = config.offset
-        crop_video(final_path, crop_values, crop_mode="center", replace_original=not config.debug)
-    
-    # 3. Очистка временных файлов
-    if config.clean:
-        cleanup()
+FICLONE = 0x40049409  # ioctl Linux для reflink-копии (btrfs, xfs)
+
+
+def publish(source, target, move: bool = False) -> Path:
+    """
+    Атомарно публикует файл source по пути target без копирования байтов, где это возможно.
+
+    Порядок: переименование (move=True), жёсткая ссылка, reflink, обычная копия.
+    Файл сначала появляется под временным именем и затем заменяет target
+    через os.replace, поэтому читатели никогда не видят его наполовину.
+
+    Args:
+        source: исходный файл
+        target: путь публикации
+        move: исходный файл больше не нужен и его можно переместить
+
+    Returns:
+        Path: target
+    """
+    import shutil
+
+    source, target = Path(source), Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+
+    if move:
+        try:
+            os.replace(source, target)
+            return target
+        except OSError:
+            pass  # Разные файловые системы
+
+    try:
+        os.link(source, tmp)
+    except OSError:
+        try:
+            if fcntl is None:
+                raise OSError("reflink недоступен")
+            with open(source, "rb") as src, open(tmp, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(source, tmp)
+        except OSError:
+            shutil.copy2(source, tmp)
+    os.replace(tmp, target)
+    return target
+
+
+def cache_store(key: str, path) -> Path:
+    """
+    Сохраняет результат рендеринга в кэш под ключом key.
+
+    Returns:
+        Path: путь к файлу в кэше
+    """
+    path = Path(path)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cached = CACHE_DIR / f"{key}{path.suffix}"
+    publish(path, cached)
+    record_output(path, key)
+    return cached
+
+
+def cache_restore(cached: Path, target: Path) -> None:
+    """
+    Публикует файл из кэша в целевую директорию (если это ещё не тот же самый файл).
+    """
+    if not (target.exists() and os.path.samefile(target, cached)):
+        publish(cached, target)
+    stat = cached.stat()
+    os.utime(cached, (time.time(), stat.st_mtime))  # Для вытеснения давно не используемых (output_cache_evict)
+    record_output(target, cached.stem)
+
+
+_tex_stats = {"hits": 0, "misses": 0}
+
+
+TEX_LOCKS = 64  # Блокировок общего кэша LaTeX (формулы распределяются по хэшу)
+
+
+@contextmanager
+def _tex_lock(expression: str):
+    """
+    Блокировка формулы в общем кэше LaTeX на время её компиляции.
+
+    Manim пишет .tex, .dvi и .svg прямо в tex_dir, и два процесса, компилирующих
+    одну формулу, портили бы файлы друг друга, а читатель мог взять недописанный
+    SVG. Блокировок фиксированное число: разные формулы с одним номером просто
+    компилируются по очереди.
+    """
+    import hashlib
+
+    if fcntl is None:
+        yield
+        return
+    stripe = int(hashlib.sha1(expression.encode("utf-8")).hexdigest(), 16) % TEX_LOCKS
+    lock_dir = TEX_CACHE_DIR / ".locks"
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    with open(lock_dir / str(stripe), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _svg_complete(path: Path) -> bool:
+    """
+    SVG дописан до конца (процесс, который его писал, мог быть убит).
+    """
+    with open(path, "rb") as f:
+        f.seek(max(0, path.stat().st_size - 64))
+        return b"</svg>" in f.read()
+
+
+def _install_tex_hook():
+    """
+    Оборачивает tex_to_svg_file Manim: компиляция формулы идёт под блокировкой
+    (_tex_lock), обрывки SVG компилируются заново, считаются попадания в кэш
+    LaTeX и обновляется время доступа (для вытеснения давно не используемых формул).
+    """
+    from manim.utils import tex_file_writing
+    original = tex_file_writing.tex_to_svg_file
+    if getattr(original, "_counted", False):
+        return
+
+    def tex_to_svg_file(*args, **kwargs):
+        with _tex_lock(str(args[0] if args else kwargs.get("expression", ""))):
+            start = time.time()
+            svg_path = Path(original(*args, **kwargs))
+            if not _svg_complete(svg_path):
+                svg_path.unlink()
+                svg_path = Path(original(*args, **kwargs))
+        stat = svg_path.stat()
+        _tex_stats["hits" if stat.st_mtime < start else "misses"] += 1
+        os.utime(svg_path, (time.time(), stat.st_mtime))
+        return svg_path
+
+    tex_to_svg_file._counted = True
+    tex_file_writing.tex_to_svg_file = tex_to_svg_file
+    from manim.mobject.text import tex_mobject
+    if hasattr(tex_mobject, "tex_to_svg_file"):
+        tex_mobject.tex_to_svg_file = tex_to_svg_file
+
+
+def _install_encoder_hook():
+    """
+    Ограничивает потоки кодировщика, которым Manim пишет отрезки видео,
+    значением FFMPEG_THREADS (по умолчанию x264 занимает все ядра, и
+    несколько воркеров пула делили бы одни и те же ядра).
+    """
+    from manim.scene.scene_file_writer import SceneFileWriter
+    original = SceneFileWriter.open_partial_movie_stream
+    if getattr(original, "_threaded", False):
+        return
+
+    def open_partial_movie_stream(self, *args, **kwargs):
+        original(self, *args, **kwargs)
+        stream = getattr(self, "video_stream", None)
+        if FFMPEG_THREADS and stream is not None:
+            stream.codec_context.thread_count = FFMPEG_THREADS  # Кодек ещё не открыт: до первого кадра
+
+    open_partial_movie_stream._threaded = True
+    SceneFileWriter.open_partial_movie_stream = open_partial_movie_stream
+
+
+def _flush_tex_stats():
+    """
+    Добавляет счётчики текущего процесса в media/.cache/tex_stats.json.
+    """
+    if not any(_tex_stats.values()):
+        return
+    stats_path = CACHE_DIR / "tex_stats.json"
+    stats = json.loads(stats_path.read_text(encoding="utf-8")) if stats_path.is_file() else {"hits": 0, "misses": 0}
+    for name in ("hits", "misses"):
+        stats[name] += _tex_stats[name]
+        _tex_stats[name] = 0
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    stats_path.write_text(json.dumps(stats), encoding="utf-8")
 
+
+def _tex_cache_entries() -> list:
+    """
+    Группирует файлы кэшей LaTeX/Text по хэшу (.tex, .dvi, .svg одной формулы).
+
+    Returns:
+        list: [(последний доступ, размер, [файлы])]
+    """
+    groups = {}
+    for cache_dir in (TEX_CACHE_DIR, TEXT_CACHE_DIR):
+        if cache_dir.exists():
+            for path in cache_dir.iterdir():
+                if path.is_file():
+                    groups.setdefault((cache_dir, path.stem), []).append(path)
+    entries = []
+    for files in groups.values():
+        stats = [f.stat() for f in files]
+        entries.append((max(st.st_atime for st in stats), sum(st.st_size for st in stats), files))
+    return entries
+
+
+def _evict(entries, max_bytes: int) -> int:
+    """
+    Удаляет самые давно использованные записи [(время доступа, размер, [файлы])],
+    пока их общий размер больше max_bytes.
+
+    Returns:
+        int: сколько байт освобождено
+    """
+    entries = sorted(entries, key=lambda entry: entry[0])
+    total = sum(entry[1] for entry in entries)
+    freed = 0
+    for _, size, files in entries:
+        if total - freed <= max_bytes:
+            break
+        for path in files:
+            path.unlink(missing_ok=True)
+        freed += size
+    return freed
+
+
+def tex_cache_evict(max_bytes: int = TEX_CACHE_BUDGET) -> int:
+    """
+    Удаляет давно не использованные формулы, пока кэш не уложится в max_bytes.
+
+    Returns:
+        int: сколько байт освобождено
+    """
+    freed = _evict(_tex_cache_entries(), max_bytes)
+    if freed:
+        print(f"Кэш LaTeX: освобождено {freed / 1024 ** 2:.1f} МБ")
+    return freed
+
+
+def partial_cache_evict(max_bytes: int = PARTIAL_CACHE_BUDGET) -> int:
+    """
+    Удаляет давно не использованные отрезки анимаций, пока кэш не уложится в max_bytes.
+
+    Returns:
+        int: сколько байт освобождено
+    """
+    entries = []
+    if PARTIAL_CACHE_DIR.exists():
+        for path in PARTIAL_CACHE_DIR.rglob("*"):
+            if not path.is_file():
+                continue
+            stat = path.stat()
+            entries.append((stat.st_atime, stat.st_size, [path]))
+    freed = _evict(entries, max_bytes)
+    if freed:
+        print(f"Кэш отрезков анимаций: освобождено {freed / 1024 ** 2:.1f} МБ")
+    return freed
+
+
+OUTPUT_NAME = re.compile(r"[0-9a-f]{64}\.\w+")
+
+
+def output_cache_evict(max_bytes: int = OUTPUT_CACHE_BUDGET, formula_bytes: int = FORMULA_CACHE_BUDGET) -> int:
+    """
+    Удаляет давно не использованные готовые результаты (cache_store) и формулы
+    (render_formulas), пока кэши не уложатся в max_bytes и formula_bytes.
+
+    Опубликованные файлы остаются: в кэше лежит лишь ещё одна жёсткая ссылка,
+    а после вытеснения результат просто рендерится заново.
+
+    Returns:
+        int: сколько байт освобождено
+    """
+    entries = []
+    if CACHE_DIR.exists():
+        for path in CACHE_DIR.iterdir():
+            if path.is_file() and OUTPUT_NAME.fullmatch(path.name):
+                stat = path.stat()
+                entries.append((stat.st_atime, stat.st_size, [path]))
+    freed = _evict(entries, max_bytes)
+
+    groups = {}
+    if FORMULA_CACHE_DIR.exists():
+        for path in FORMULA_CACHE_DIR.iterdir():
+            if path.is_file():
+                groups.setdefault(path.stem, []).append(path)  # .png и .svg одной формулы
+    entries = []
+    for files in groups.values():
+        stats = [f.stat() for f in files]
+        entries.append((max(st.st_atime for st in stats), sum(st.st_size for st in stats), files))
+    freed += _evict(entries, formula_bytes)
+    if freed:
+        print(f"Кэш результатов: освобождено {freed / 1024 ** 2:.1f} МБ")
+    return freed
+
+
+def tex_cache_stats() -> dict:
+    """
+    Печатает и возвращает статистику кэша LaTeX/Text: попадания, промахи, размер.
+    """
+    _flush_tex_stats()
+    stats_path = CACHE_DIR / "tex_stats.json"
+    stats = json.loads(stats_path.read_text(encoding="utf-8")) if stats_path.is_file() else {"hits": 0, "misses": 0}
+    entries = _tex_cache_entries()
+    lookups = stats["hits"] + stats["misses"]
+    stats.update({
+        "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+        "entries": len(entries),
+        "bytes": sum(entry[1] for entry in entries),
+        "budget": TEX_CACHE_BUDGET,
+    })
+    print(ctext("Кэш LaTeX/Text", "cyan", "bold"))
+    print(f"  Попаданий: {stats['hits']}, промахов: {stats['misses']} ({stats['hit_rate']:.0%})")
+    print(f"  Формул: {stats['entries']}, размер: {stats['bytes'] / 1024 ** 2:.1f} / {TEX_CACHE_BUDGET / 1024 ** 2:.0f} МБ")
+    return stats
+
+
+QUALITY_NAMES = {
+    "l": "low_quality",
+    "m": "medium_quality",
+    "h": "high_quality",
+    "p": "production_quality",
+    "k": "fourk_quality",
+}
+
+
+@contextmanager
+def partial_movie_dir(scene, quality: str):
+    """
+    Отдельная директория отрезков анимаций для одного рендеринга.
+
+    Manim пишет в partial_movie_dir и отрезки, и их список для склейки,
+    поэтому параллельные рендеры одной сцены (планировщик, демон, части
+    render_scene_chunked) не могут работать в общей директории. Каждый
+    получает свою: готовые отрезки сцены попадают в неё из PARTIAL_CACHE_DIR
+    жёсткими ссылками, а новые после рендеринга атомарно публикуются
+    обратно. Имя отрезка - хэш анимации, так что одинаковые имена у разных
+    рендеров означают одинаковое содержимое.
+
+    Args:
+        scene: класс сцены Manim
+        quality: качество рендеринга ('l', 'm', 'h', 'p', 'k')
+    """
+    import shutil
+    import tempfile
+
+    shared = PARTIAL_CACHE_DIR / QUALITY_NAMES[quality] / scene.__name__
+    PARTIAL_JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    # pid в имени: cleanup удаляет директории убитых процессов
+    private = Path(tempfile.mkdtemp(prefix=f"{os.getpid()}_{scene.__name__}_", dir=PARTIAL_JOBS_DIR))
+    try:
+        if shared.is_dir():
+            for path in shared.iterdir():
+                if path.is_file():
+                    publish(path, private / path.name)
+        yield private
+
+        shared.mkdir(parents=True, exist_ok=True)
+        for path in private.iterdir():
+            if path.is_file() and path.suffix != ".txt" and not (shared / path.name).exists():
+                publish(path, shared / path.name, move=True)
+    finally:
+        shutil.rmtree(private, ignore_errors=True)
+
+
+def render_scene(scene, quality: str = "l", image: bool = False, transparent: bool = False,
+                 media_dir=None, output_file=None, options=None) -> Path:
+    """
+    Рендерит сцену в текущем процессе, без запуска отдельного `manim`.
+
+    Отрезки видео (по одному на self.play) хранятся в PARTIAL_CACHE_DIR под
+    хэшем анимации, поэтому Manim перерисовывает только изменённые вызовы
+    play, а остальные склеивает без перекодирования (concat demuxer).
+    Сам рендеринг идёт в отдельной директории отрезков (см. partial_movie_dir).
+
+    Args:
+        scene: класс сцены Manim
+        quality: качество рендеринга ('l', 'm', 'h', 'p', 'k')
+        image: сохранить только последний кадр в PNG вместо видео
+        transparent: рендерить с прозрачным фоном
+        media_dir: медиа директория Manim (по умолчанию MEDIA_DIR)
+        output_file: имя выходного файла Manim (по умолчанию имя сцены)
+        options: дополнительные параметры tempconfig (перекрывают перечисленные)
+
+    Returns:
+        Path: путь к файлу, который записал Manim
+    """
+    from manim import tempconfig
+
+    options = {
+        "output_file": output_file or scene.__name__,
+        "quality": QUALITY_NAMES[quality],
+        "media_dir": str(media_dir or MEDIA_DIR),
+        "tex_dir": str(TEX_CACHE_DIR.resolve()),
+        "no_latex_cleanup": True,     # Иначе Manim удаляет .tex/.dvi, которые компилирует другой процесс
+        "text_dir": str(TEXT_CACHE_DIR.resolve()),
+        "disable_caching": False,
+        "max_files_cached": -1,       # Размер кэша ограничивает partial_cache_evict
+        "transparent": transparent,
+        "save_last_frame": image,
+        "write_to_movie": not image,
+        "verbosity": "WARNING",
+        "progress_bar": "none",
+        **(options or {}),
+    }
+    _install_tex_hook()
+    _install_encoder_hook()
+    with partial_movie_dir(scene, quality) as partial_dir, \
+            tempconfig({"partial_movie_dir": str(partial_dir.resolve()), **options}):
+        instance = scene()
+        instance.render()
+        file_writer = instance.renderer.file_writer
+        output = Path(file_writer.image_file_path if image else file_writer.movie_file_path)
+
+        # Отмечаем использованные отрезки (жёсткие ссылки на файлы кэша), чтобы вытеснялись только давно ненужные
+        now = time.time()
+        for partial in getattr(file_writer, "partial_movie_files", None) or []:
+            if partial and os.path.isfile(partial):
+                os.utime(partial, (now, os.path.getmtime(partial)))
+    _flush_tex_stats()
+    return output
+
+
+def _encode_cmd(width: int, height: int, fps: float, crop_filter: str, source: str, output: str) -> list[str]:
+    """
+    Команда ffmpeg, которая кодирует сырые RGBA кадры в mp4 с обрезкой.
+    """
+    cmd = [
+        'ffmpeg',
+        '-f', 'rawvideo',                       # Сырые кадры без контейнера
+        '-pix_fmt', 'rgba',
+        '-s', f'{width}x{height}',
+        '-r', str(fps),
+        '-i', source,                           # Файл или '-' (stdin)
+        '-vf', f'{crop_filter},format=yuv420p', # Обрезка в том же проходе
+        '-c:v', 'libx264',
+        '-movflags', '+faststart',
+        '-loglevel', 'error',
+        '-y',
+        output
+    ]
+    if FFMPEG_THREADS:
+        cmd[-1:-1] = ['-threads', str(FFMPEG_THREADS)]   # Потоки кодировщика x264
+    return cmd
+
+
+def _crop_filter(width: int, height: int, offsets) -> str:
+    """
+    Фильтр crop= по отступам (left, top, right, bottom); размеры делаются чётными для yuv420p.
+    """
+    left, top, right, bottom = offsets
+    if min(offsets) < 0:
+        raise ValueError("Отступы не могут быть отрицательными")
+    crop_width = (width - left - right) // 2 * 2
+    crop_height = (height - top - bottom) // 2 * 2
+    if crop_width <= 0 or crop_height <= 0:
+        raise ValueError(f"Отступы {offsets} больше размера кадра ({width}x{height})")
+    return f"crop={crop_width}:{crop_height}:{left}:{top}"
+
+
+def _spool():
+    """
+    Временный файл для несжатых RGBA кадров (гигабайты для длинной сцены).
+
+    Лежит в media/.cache, а не в /tmp (часто это небольшой tmpfs), и удаляется
+    из директории сразу при создании, поэтому не остаётся на диске, даже если
+    процесс убит. ffmpeg читает его как stdin.
+    """
+    import tempfile
+
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    return tempfile.TemporaryFile(suffix=".rgba", dir=SPOOL_DIR)
+
+
+class FrameConsumer:
+    """
+    Потребитель кадров для stream_scene. Получает каждый кадр сцены ровно
+    один раз в виде массива NumPy (height, width, 4) RGBA uint8.
+    """
+    def start(self, width: int, height: int, fps: float):
+        self.width, self.height, self.fps = width, height, fps
+
+    def consume(self, frame):
+        pass
+
+    def finish(self):
+        return None
+
+
+class ContentBox(FrameConsumer):
+    """
+    Общая рамка содержимого по всем кадрам. Результат - отступы (left, top, right, bottom).
+    Содержимое - пиксели ярче threshold, а для прозрачных кадров (alpha=True) - непрозрачные.
+    """
+    def __init__(self, threshold: int = 10, alpha: bool = False):
+        self.threshold = threshold
+        self.alpha = alpha
+
+    def start(self, width, height, fps):
+        super().start(width, height, fps)
+        self.box = [width, height, 0, 0]
+
+    def consume(self, frame):
+        mask = frame[..., 3] > 0 if self.alpha else frame[..., :3].max(axis=2) > self.threshold
+        cols = np.flatnonzero(mask.any(axis=0))
+        if cols.size:
+            rows = np.flatnonzero(mask.any(axis=1))
+            self.box = [min(self.box[0], cols[0]), min(self.box[1], rows[0]),
+                        max(self.box[2], cols[-1] + 1), max(self.box[3], rows[-1] + 1)]
+
+    def finish(self):
+        if self.box[2] <= self.box[0]:
+            return (0, 0, 0, 0)  # Пустая сцена - не обрезаем
+        left, top, right, bottom = self.box
+        return (int(left), int(top), int(self.width - right), int(self.height - bottom))
+
+
+class Crop(FrameConsumer):
+    """
+    Передаёт вложенным потребителям обрезанные кадры (срез массива, без копирования).
+    """
+    def __init__(self, offsets, consumers: list):
+        self.offsets = offsets
+        self.consumers = consumers
+
+    def start(self, width, height, fps):
+        super().start(width, height, fps)
+        left, top, right, bottom = self.offsets
+        self.window = (slice(top, height - bottom), slice(left, width - right))
+        for consumer in self.consumers:
+            consumer.start(width - left - right, height - top - bottom, fps)
+
+    def consume(self, frame):
+        frame = frame[self.window]
+        for consumer in self.consumers:
+            consumer.consume(frame)
+
+    def finish(self):
+        return [consumer.finish() for consumer in self.consumers]
+
+
+class VideoEncoder(FrameConsumer):
+    """
+    Кодирует кадры в mp4 одним процессом ffmpeg, с обрезкой в том же проходе.
+
+    crop: отступы (left, top, right, bottom), None или 'auto'. Известные отступы
+    применяются сразу, кадры идут в ffmpeg через pipe. Для 'auto' кадры пишутся
+    в несжатый временный файл (_spool), по ходу считается рамка содержимого,
+    и затем выполняется единственное кодирование.
+    """
+    def __init__(self, path, crop=None, threshold: int = 10):
+        self.path = Path(path)
+        self.crop = crop
+        self.box = ContentBox(threshold) if crop == "auto" else None
+        self.temp_path = self.path.with_name(f"{self.path.stem}.{os.getpid()}.temp.mp4")
+
+    def start(self, width, height, fps):
+        import subprocess
+
+        super().start(width, height, fps)
+        if self.box is not None:
+            self.box.start(width, height, fps)
+            self.process = None
+            self.sink = _spool()
+        else:
+            crop_filter = _crop_filter(width, height, self.crop or (0, 0, 0, 0))
+            self.process = subprocess.Popen(
+                _encode_cmd(width, height, fps, crop_filter, '-', str(self.temp_path)), stdin=subprocess.PIPE
+            )
+            self.sink = self.process.stdin
+
+    def consume(self, frame):
+        if self.box is not None:
+            self.box.consume(frame)
+        self.sink.write(np.ascontiguousarray(frame).data)
+
+    def finish(self):
+        import subprocess
+
+        if self.process is not None:
+            self.sink.close()
+            if self.process.wait() != 0:
+                raise RuntimeError(f"Ошибка FFmpeg при кодировании {self.path}")
+        else:
+            offsets = self.box.finish()
+            print(f"Найденные отступы: {offsets}")
+            with self.sink:
+                self.sink.seek(0)
+                subprocess.run(
+                    _encode_cmd(self.width, self.height, self.fps, _crop_filter(self.width, self.height, offsets),
+                                '-', str(self.temp_path)),
+                    stdin=self.sink, check=True
+                )
+        os.replace(self.temp_path, self.path)
+        return self.path
+
+
+class LastFrame(FrameConsumer):
+    """
+    Сохраняет последний кадр в PNG (с альфа-каналом, если сцена прозрачная).
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.frame = None
+
+    def consume(self, frame):
+        self.frame = frame
+
+    def finish(self):
+        if self.frame is None:
+            return None
+        Image.fromarray(np.ascontiguousarray(self.frame), "RGBA").save(self.path)
+        return self.path
+
+
+class Thumbnail(FrameConsumer):
+    """
+    Сохраняет уменьшенную копию кадра с номером index (по умолчанию первого).
+    """
+    def __init__(self, path, size=(320, 180), index: int = 0):
+        self.path = Path(path)
+        self.size = size
+        self.index = index
+        self.count = 0
+        self.image = None
+
+    def consume(self, frame):
+        if self.count == self.index:
+            self.image = Image.fromarray(np.ascontiguousarray(frame), "RGBA")
+            self.image.thumbnail(self.size)
+        self.count += 1
+
+    def finish(self):
+        if self.image is None:
+            return None
+        self.image.save(self.path)
+        return self.path
+
+
+class LoopExport(FrameConsumer):
+    """
+    Зацикленная анимация GIF, APNG или WebP из прозрачных кадров.
+
+    Кадры пишутся в несжатый временный файл (_spool), по альфа-каналу считается
+    общая рамка содержимого (+ padding, как у PNG в createAnim), затем
+    один проход ffmpeg. Для GIF палитра строится и применяется в одном
+    графе фильтров (palettegen/paletteuse), а неизменившиеся области
+    кадров кодируются прозрачными (diff_mode, transdiff). Если результат
+    больше max_bytes, он перекодируется с меньшим масштабом и палитрой.
+    """
+    def __init__(self, path, loop_format: str = "gif", padding: int = 20, max_bytes=None,
+                 fps=None, colors: int = 256):
+        if loop_format not in LOOP_FORMATS:
+            raise ValueError(f"Неизвестный формат {loop_format}. Допустимые значения: {', '.join(LOOP_FORMATS)}")
+        self.path = Path(path)
+        self.loop_format = loop_format
+        self.padding = padding
+        self.max_bytes = max_bytes
+        self.out_fps = fps
+        self.colors = colors
+        self.box = ContentBox(alpha=True)
+
+    def start(self, width, height, fps):
+        super().start(width, height, fps)
+        self.box.start(width, height, fps)
+        self.sink = _spool()
+
+    def consume(self, frame):
+        self.box.consume(frame)
+        self.sink.write(np.ascontiguousarray(frame).data)
+
+    def _command(self, crop_filter: str, scale: float, colors: int, output: str) -> list[str]:
+        video_filter = crop_filter
+        if scale < 1:
+            video_filter += f",scale=trunc(iw*{scale}/2)*2:-2:flags=lanczos"
+        if self.out_fps:
+            video_filter += f",fps={self.out_fps}"
+
+        cmd = [
+            'ffmpeg', '-v', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{self.width}x{self.height}', '-r', str(self.fps),
+            '-i', '-',
+        ]
+        if self.loop_format == "gif":
+            cmd += [
+                '-filter_complex',
+                f"[0:v]{video_filter},split[a][b];"
+                f"[a]palettegen=max_colors={colors}:reserve_transparent=1:stats_mode=diff[p];"
+                f"[b][p]paletteuse=dither=bayer:bayer_scale=3:diff_mode=rectangle:alpha_threshold=128",
+                '-gifflags', '+transdiff',
+                '-loop', '0',
+                '-f', 'gif',
+            ]
+        elif self.loop_format == "apng":
+            cmd += ['-vf', video_filter, '-pix_fmt', 'rgba', '-plays', '0', '-f', 'apng']
+        else:
+            cmd += ['-vf', video_filter, '-c:v', 'libwebp_anim', '-pix_fmt', 'yuva420p',
+                    '-quality', '75', '-loop', '0', '-f', 'webp']
+        return cmd + ['-y', output]
+
+    def finish(self):
+        import subprocess
+
+        with self.sink:
+            left, top, right, bottom = self.box.finish()
+            # Отступ вокруг содержимого, как у PNG
+            left, top = max(left - self.padding, 0), max(top - self.padding, 0)
+            right, bottom = max(right - self.padding, 0), max(bottom - self.padding, 0)
+            crop_filter = f"crop={self.width - left - right}:{self.height - top - bottom}:{left}:{top}"
+
+            temp_path = self.path.with_name(f"{self.path.stem}.{os.getpid()}.temp{self.path.suffix}")
+            scale, colors = 1.0, self.colors
+            for _ in range(4):
+                self.sink.seek(0)
+                subprocess.run(self._command(crop_filter, scale, colors, str(temp_path)), stdin=self.sink, check=True)
+                size = os.path.getsize(temp_path)
+                if not self.max_bytes or size <= self.max_bytes:
+                    break
+                print(ctext(f"{self.path.name}: {size / 1024:.0f} КБ больше бюджета, уменьшаем", "yellow"))
+                scale *= 0.75
+                colors = max(32, colors // 2)
+            os.replace(temp_path, self.path)
+        return self.path
+
+
+def stream_scene(scene, consumers: list, quality: str = "l", transparent: bool = False, media_dir=None) -> list:
+    """
+    Рендерит сцену один раз и передаёт каждый кадр всем потребителям, без
+    промежуточных файлов Manim и повторного декодирования.
+
+    Args:
+        scene: класс сцены Manim
+        consumers: список FrameConsumer (ContentBox, Crop, VideoEncoder, LastFrame, Thumbnail, ...)
+        quality: качество рендеринга ('l', 'm', 'h', 'p', 'k')
+        transparent: рендерить с прозрачным фоном (кадры RGBA с альфой)
+        media_dir: медиа директория Manim (по умолчанию MEDIA_DIR)
+
+    Returns:
+        list: результаты finish() потребителей в том же порядке
+    """
+    from manim import config, tempconfig
+
+    options = {
+        "quality": QUALITY_NAMES[quality],
+        "media_dir": str(media_dir or MEDIA_DIR),
+        "tex_dir": str(TEX_CACHE_DIR.resolve()),
+        "no_latex_cleanup": True,
+        "text_dir": str(TEXT_CACHE_DIR.resolve()),
+        "transparent": transparent,
+        "write_to_movie": False,
+        "save_last_frame": False,
+        "verbosity": "WARNING",
+        "progress_bar": "none",
+    }
+    _install_tex_hook()
+    with tempconfig(options):
+        for consumer in consumers:
+            consumer.start(config.pixel_width, config.pixel_height, config.frame_rate)
+        instance = scene()
+        frames = [0]
+
+        def write_frame(frame, repeat=1, num_frames=None):
+            # Сигнатура SceneFileWriter.write_frame: manim >= 0.19 передаёт repeat, более ранние - num_frames
+            repeat = num_frames or repeat
+            frame = np.asarray(frame)
+            frames[0] += repeat
+            for _ in range(repeat):
+                for consumer in consumers:
+                    consumer.consume(frame)
+
+        instance.renderer.file_writer.write_frame = write_frame
+        try:
+            instance.render()
+            if not frames[0]:
+                # Сцена без анимаций - единственный статичный кадр
+                instance.renderer.update_frame(instance)
+                write_frame(instance.renderer.get_frame())
+        finally:
+            _flush_tex_stats()
+        return [consumer.finish() for consumer in consumers]
+
+
+def iter_frames(scene, quality: str = "l", transparent: bool = False, media_dir=None, buffer: int = 8):
+    """
+    Генератор кадров сцены: рендеринг идёт в отдельном потоке, кадры
+    (копии массивов RGBA) отдаются по мере готовности.
+
+    Yields:
+        np.ndarray: кадр (height, width, 4) uint8
+    """
+    import queue
+
+    frames = queue.Queue(maxsize=buffer)
+    done = object()
+    errors = []
+
+    class Forward(FrameConsumer):
+        def consume(self, frame):
+            frames.put(frame.copy())
+
+    def run():
+        try:
+            stream_scene(scene, [Forward()], quality, transparent, media_dir)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            frames.put(done)
+
+    threading.Thread(target=run, daemon=True).start()
+    while (frame := frames.get()) is not done:
+        yield frame
+    if errors:
+        raise errors[0]
+
+
+def render_scene_cropped(scene, target, quality: str = "l", crop=(0, 0, 0, 0), threshold: int = 10,
+                         media_dir=None) -> Path:
+    """
+    Рендерит сцену в mp4 за одно кодирование, применяя обрезку к кадрам Manim.
+
+    Кадры Manim не пишутся в его собственный mp4, а передаются в один процесс
+    ffmpeg с фильтром crop= (см. VideoEncoder).
+
+    Args:
+        scene: класс сцены Manim
+        target: путь к итоговому mp4
+        quality: качество рендеринга ('l', 'm', 'h', 'p', 'k')
+        crop: отступы (left, top, right, bottom) или 'auto' (по содержимому)
+        threshold: порог черного цвета для crop='auto' (0-255)
+        media_dir: медиа директория Manim (по умолчанию MEDIA_DIR)
+
+    Returns:
+        Path: путь к итоговому mp4
+    """
+    return stream_scene(scene, [VideoEncoder(target, crop, threshold)], quality, media_dir=media_dir)[0]
+
+
+def render_scenes(scenes, quality: str = "l", image_mode: bool = False, video_mode: bool = True) -> dict:
+    """
+    Рендерит несколько сцен (и изображение, и видео каждой) в одном процессе.
+
+    Args:
+        scenes: список классов сцен Manim
+        quality: качество рендеринга ('l', 'm', 'h', 'p', 'k')
+        image_mode: рендерить PNG с прозрачным фоном
+        video_mode: рендерить mp4
+
+    Returns:
+        dict: {имя сцены: {'png': Path, 'mp4': Path}}
+    """
+    results = {}
+    for scene in scenes:
+        outputs = {}
+        if image_mode:
+            outputs["png"] = render_scene(scene, quality, image=True, transparent=True)
+        if video_mode:
+            outputs["mp4"] = render_scene(scene, quality)
+        results[scene.__name__] = outputs
+    return results
+
+
+def crop_png(source, target, padding: int = 20):
+    """
+    Обрезает PNG по непрозрачному содержимому с отступом.
+
+    Args:
+        source: исходный PNG с альфа-каналом
+        target: путь для обрезанного PNG (запись атомарная)
+        padding: отступ вокруг содержимого в пикселях
+
+    Returns:
+        tuple | None: рамка обрезки (left, upper, right, lower) или None, если изображение пустое
+    """
+    target = Path(target)
+    img = Image.open(source)
+    alpha = img.split()[-1]
+    bbox = alpha.getbbox()
+    if not bbox:
+        return None
+
+    left, upper, right, lower = bbox
+    # Добавляем отступ
+    left = max(left - padding, 0)
+    upper = max(upper - padding, 0)
+    right = min(right + padding, img.width)
+    lower = min(lower + padding, img.height)
+    img_cropped = img.crop((left, upper, right, lower))
+
+    # Сохраняем обрезанное изображение (атомарно, через временный файл)
+    tmp_path = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    img_cropped.save(tmp_path, format="PNG")
+    os.replace(tmp_path, target)
+    return left, upper, right, lower
+
+
+def createAnim(formula_name: str, outpath: str = "math", image_mode: bool = False, 
+         video_mode: bool = False, quality: str = "l", scene="Formula", crop=None, use_cache: bool = True,
+         media_dir=None, loop_format=None, loop_max_bytes=None, daemon: bool = True, chunks: int = 1):
+    """
+    Основная функция рендеринга.
+
+    Если запущен демон рендеринга (см. serve), задача отправляется ему и
+    выполняется в уже прогретом процессе, иначе - в текущем.
+    
+    Args:
+        formula_name: название выходного файла
+        outpath: путь для сохранения результатов
+        image_mode: рендерить ли изображение
+        video_mode: рендерить ли видео
+        quality: качество рендеринга ('l' - low, 'm' - medium, 'h' - high, 'p' - production)
+        scene: класс сцены Manim или её имя (см. resolve_scene)
+        crop: отступы обрезки видео (left, top, right, bottom), 'auto' (по содержимому) или None
+        use_cache: пропускать рендеринг, если результат с тем же ключом уже есть в кэше
+        media_dir: отдельная медиа директория Manim (по умолчанию MEDIA_DIR)
+        loop_format: дополнительно сохранить зацикленную анимацию ('gif', 'apng', 'webp')
+        loop_max_bytes: предельный размер зацикленной анимации в байтах (None - без ограничения)
+        daemon: использовать демон рендеринга, если он запущен
+        chunks: рендерить видео частями в нескольких процессах (0 - по числу ядер, 1 - одним процессом)
+    """
+    if daemon and media_dir is None:
+        job = {
+            "formula_name": formula_name, "outpath": outpath, "image_mode": image_mode, "video_mode": video_mode,
+            "quality": quality, "scene": _scene_ref(scene), "crop": crop, "use_cache": use_cache,
+            "loop_format": loop_format, "loop_max_bytes": loop_max_bytes, "chunks": chunks,
+        }
+        result = daemon_request({"cmd": "render", "job": job, "cwd": os.getcwd()}, on_event=_print_daemon_event)
+        if result is not None and result.get("event") == "result":
+            if not result["ok"]:
+                raise RuntimeError(result["error"])
+            return
+        if result is not None:
+            # Воркер демона упал или соединение оборвалось - рендерим здесь
+            reason = result.get("error") or "соединение прервано"
+            print(ctext(f"Демон рендеринга не выполнил задачу ({reason}), рендеринг в этом процессе", "yellow"))
+
+    from manim import config
+
+    scene = resolve_scene(scene)
+
+    # Создаем целевую директорию
+    target_dir = Path(outpath)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    
+    image_mode = image_mode or not (video_mode or loop_format)
+    print(f"Режимы - Изображение: {image_mode}, Видео: {video_mode}, Качество: {quality}")
+    streamed = False  # PNG и видео уже получены за один проход
+
+    # PNG и видео из одного рендеринга: каждый кадр растеризуется один раз.
+    # Прозрачные кадры в mp4 дают чёрный фон, поэтому только для чёрного фона сцены.
+    if image_mode and video_mode and str(config.background_color).upper() == "#000000":
+        png_key = render_key(scene, "transparent", quality)
+        mp4_key = render_key(scene, "mp4", quality, crop)
+        if not use_cache or not (cache_lookup(png_key, ".png") or cache_lookup(mp4_key, ".mp4")):
+            print("Рендеринг изображения и видео за один проход...")
+            target_path = target_dir / f"{formula_name}.png"
+            target_mp4 = target_dir / f"{formula_name}.mp4"
+            last_png = target_dir / f".{formula_name}.{os.getpid()}.last.png"
+            with stage("manim_stream") as record:
+                stream_scene(scene, [LastFrame(last_png), VideoEncoder(target_mp4, crop)],
+                             quality, transparent=True, media_dir=media_dir)
+                record["outputs"] += [last_png, target_mp4]
+            with stage("pil_crop", inputs=[last_png]) as record:
+                bbox = crop_png(last_png, target_path)
+                os.remove(last_png)
+                record["outputs"].append(target_path)
+            with stage("cache_store", inputs=[target_mp4]):
+                if bbox:
+                    cache_store(png_key, target_path)
+                cache_store(mp4_key, target_mp4)
+            print(f"Изображение сохранено: {target_path}")
+            print(f"Видео сохранено: {target_mp4}")
+            streamed = True
+
+    # Рендеринг изображения
+    if image_mode and not streamed:
+        target_path = target_dir / f"{formula_name}.png"
+        key = render_key(scene, "transparent", quality)
+        cached = cache_lookup(key, ".png") if use_cache else None
+
+        if cached:
+            with stage("cache_restore", inputs=[cached]):
+                cache_restore(cached, target_path)
+            print(ctext(f"Изображение взято из кэша: {target_path}", "green"))
+        else:
+            print("Рендеринг изображения...")
+            
+            # Рендеринг PNG с прозрачным фоном (имя файла уникально для задачи)
+            with stage("manim_png") as record:
+                last_png = render_scene(scene, quality, image=True, transparent=True, media_dir=media_dir,
+                                        output_file=f"{formula_name}_{key[:12]}")
+                record["outputs"].append(last_png)
+            
+            # Обрезка по содержимому с отступом
+            with stage("pil_crop", inputs=[last_png]) as record:
+                bbox = crop_png(last_png, target_path)
+                record["outputs"].append(target_path)
+
+            if bbox:
+                with stage("cache_store", inputs=[target_path]):
+                    cache_store(key, target_path)
+                print(f"Изображение сохранено: {target_path}")
+    
+    # Рендеринг видео
+    if video_mode and not streamed:
+        target_mp4 = target_dir / f"{formula_name}.mp4"
+        key = render_key(scene, "mp4", quality, crop)
+        cached = cache_lookup(key, ".mp4") if use_cache else None
+
+        if cached:
+            with stage("cache_restore", inputs=[cached]):
+                cache_restore(cached, target_mp4)
+            print(ctext(f"Видео взято из кэша: {target_mp4}", "green"))
+        else:
+            print("Рендеринг видео...")
+            
+            if crop == "auto" or (crop and any(crop)):
+                # Обрезка применяется в том же проходе кодирования, без повторного ffmpeg
+                with stage("manim_mp4_crop") as record:
+                    render_scene_cropped(scene, target_mp4, quality, crop, media_dir=media_dir)
+                    record["outputs"].append(target_mp4)
+            else:
+                # Рендеринг видео (без прозрачности, так как mp4 не поддерживает альфу)
+                with stage("manim_mp4") as record:
+                    if chunks != 1:
+                        last_mp4 = render_scene_chunked(scene, quality, chunks, FFMPEG_THREADS or 2, media_dir,
+                                                        output_file=f"{formula_name}_{key[:12]}")
+                    else:
+                        last_mp4 = render_scene(scene, quality, media_dir=media_dir,
+                                                output_file=f"{formula_name}_{key[:12]}")
+                    record["outputs"].append(last_mp4)
+                
+                # Перемещаем в целевую директорию без копирования
+                with stage("publish", inputs=[last_mp4]) as record:
+                    publish(last_mp4, target_mp4, move=True)
+                    record["outputs"].append(target_mp4)
+            print(f"Видео сохранено: {target_mp4}")
+
+            with stage("cache_store", inputs=[target_mp4]):
+                cache_store(key, target_mp4)
+
+    # Зацикленная анимация (GIF / APNG / WebP) с прозрачностью и обрезкой как у PNG
+    if loop_format:
+        target_loop = target_dir / f"{formula_name}{LOOP_FORMATS[loop_format]}"
+        key = output_key(scene, target_loop.suffix, quality, max_bytes=loop_max_bytes)
+        cached = cache_lookup(key, target_loop.suffix) if use_cache else None
+
+        if cached:
+            with stage("cache_restore", inputs=[cached]):
+                cache_restore(cached, target_loop)
+            print(ctext(f"Анимация взята из кэша: {target_loop}", "green"))
+        else:
+            print(f"Рендеринг {loop_format}...")
+            with stage(f"manim_{loop_format}") as record:
+                stream_scene(scene, [LoopExport(target_loop, loop_format, max_bytes=loop_max_bytes)],
+                             quality, transparent=True, media_dir=media_dir)
+                record["outputs"].append(target_loop)
+            with stage("cache_store", inputs=[target_loop]):
+                cache_store(key, target_loop)
+            print(f"Анимация сохранена: {target_loop}")
+
+    write_report(formula_name)
+
+
+def pool_size(workers: int, threads: int, tasks: int = 0) -> tuple[int, int]:
+    """
+    Число процессов и потоков кодировщика на процесс, при котором
+    процессы вместе не занимают больше ядер, чем есть.
+
+    Args:
+        workers: число процессов (0 - по числу ядер / threads)
+        threads: потоков на процесс для выбора числа процессов
+        tasks: число задач (процессов не больше, чем задач; 0 - без ограничения)
+
+    Returns:
+        tuple[int, int]: (процессов, потоков на процесс)
+    """
+    cpus = os.cpu_count() or 1
+    if not workers:
+        workers = max(1, cpus // threads)
+    if tasks:
+        workers = min(workers, tasks)
+    return workers, max(1, cpus // workers)
+
+
+def _init_worker(threads: int):
+    """
+    Инициализация процесса-воркера: ограничиваем число потоков,
+    чтобы воркеры не делили между собой одни и те же ядра.
+    """
+    global FFMPEG_THREADS
+    FFMPEG_THREADS = threads
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+
+def _run_job(job: dict) -> dict:
+    """
+    Выполняет одну задачу рендеринга в процессе-воркере.
+    """
+    name = job["formula_name"]
+    media_dir = JOBS_DIR / f"{Path(job.get('outpath', 'math')).name}_{name}"
+    start = time.perf_counter()
+    try:
+        createAnim(**job, media_dir=media_dir, daemon=False)
+        return {"name": name, "ok": True, "seconds": time.perf_counter() - start, "error": None}
+    except Exception as e:
+        return {"name": name, "ok": False, "seconds": time.perf_counter() - start, "error": str(e)}
+
+
+def render_jobs(jobs: list[dict], workers: int = 0, threads: int = 2) -> list[dict]:
+    """
+    Рендерит набор задач в ограниченном пуле процессов.
+
+    Каждая задача получает свою медиа директорию в media/jobs/, поэтому
+    параллельные рендеры не пересекаются. Результаты печатаются по мере
+    завершения задач.
+
+    Args:
+        jobs: список задач - словарей с аргументами createAnim
+              (formula_name, outpath, scene, image_mode, video_mode, quality, crop, ...)
+        workers: число процессов (0 - по числу ядер / threads)
+        threads: потоков ffmpeg на один процесс (ядра делятся между процессами поровну, см. pool_size)
+
+    Returns:
+        list[dict]: результаты задач {'name', 'ok', 'seconds', 'error'} в порядке завершения
+    """
+    workers, threads = pool_size(workers, threads, len(jobs))
+
+    print(f"Задач: {len(jobs)}, процессов: {workers}, потоков на процесс: {threads}")
+    start = time.perf_counter()
+    results = []
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        futures = [pool.submit(_run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result["ok"]:
+                print(ctext(f"[{len(results)}/{len(jobs)}] {result['name']}: {result['seconds']:.1f} с", "green"))
+            else:
+                print(ctext(f"[{len(results)}/{len(jobs)}] {result['name']}: {result['error']}", "red"))
+
+    total = time.perf_counter() - start
+    busy = sum(r["seconds"] for r in results)
+    print(ctext(f"Готово за {total:.1f} с (ускорение x{busy / total if total else 0:.1f})", "cyan", "bold"))
+    return results
+
+
+def animation_durations(scene) -> list[float]:
+    """
+    Длительности всех self.play / self.wait сцены в секундах.
+
+    Сцена проигрывается с пропуском всех анимаций (как `manim -n` с
+    номером больше их числа): construct выполняется целиком, но кадры
+    не растеризуются и файлы не пишутся.
+    """
+    from manim import tempconfig
+
+    durations = []
+    options = {
+        "tex_dir": str(TEX_CACHE_DIR.resolve()),
+        "no_latex_cleanup": True,
+        "text_dir": str(TEXT_CACHE_DIR.resolve()),
+        "from_animation_number": 10 ** 9,
+        "write_to_movie": False,
+        "save_last_frame": False,
+        "verbosity": "WARNING",
+        "progress_bar": "none",
+    }
+    _install_tex_hook()
+    with tempconfig(options):
+        instance = scene()
+        play = instance.renderer.play
+
+        def counted_play(scene_instance, *args, **kwargs):
+            play(scene_instance, *args, **kwargs)
+            durations.append(float(getattr(scene_instance, "duration", 0) or 0))
+
+        instance.renderer.play = counted_play
+        instance.render()
+    _flush_tex_stats()
+    return durations
+
+
+def split_animations(durations: list[float], chunks: int) -> list[tuple[int, int]]:
+    """
+    Делит анимации на непрерывные диапазоны с примерно равной суммарной длительностью.
+
+    Returns:
+        list[tuple[int, int]]: диапазоны (первая, последняя) номеров анимаций, включительно
+    """
+    chunks = max(1, min(chunks, len(durations)))
+    total = sum(durations)
+    ranges = []
+    start = 0
+    elapsed = 0.0
+    for index, duration in enumerate(durations):
+        elapsed += duration
+        chunks_left = chunks - len(ranges) - 1        # Сколько ещё диапазонов нужно после этого
+        animations_left = len(durations) - index - 1
+        if chunks_left and animations_left >= chunks_left and (
+                elapsed >= total * (len(ranges) + 1) / chunks or animations_left == chunks_left):
+            ranges.append((start, index))
+            start = index + 1
+    ranges.append((start, len(durations) - 1))
+    return ranges
+
+
+def _render_chunk(scene, quality: str, first: int, last: int, media_dir: str, output_file: str) -> str:
+    """
+    Рендерит анимации first..last сцены в процессе-воркере (как `manim -n first,last`).
+    """
+    options = {
+        "from_animation_number": first,
+        "upto_animation_number": last,
+    }
+    return str(render_scene(scene, quality, media_dir=media_dir,
+                            output_file=f"{output_file}_n{first}-{last}", options=options))
+
+
+def _edge_frame(path, last: bool = False):
+    """
+    Первый или последний кадр видео в оттенках серого.
+
+    Видео не декодируется целиком: для первого кадра ffmpeg останавливается
+    после него, для последнего - начинает с секунды до конца (-sseof).
+    """
+    info = probe_video(path)
+    frames = _gray_frames(path, "null", info["width"], info["height"], batch=1,
+                          seek=['-sseof', '-1'] if last else ())
+    try:
+        frame = next(frames)
+        if last:
+            for frame in frames:
+                pass
+        return frame[0]
+    finally:
+        frames.close()
+
+
+class ChunkSeamError(RuntimeError):
+    """
+    Последний кадр части не совпал с первым кадром следующей (см. concat_videos).
+    """
+
+
+def concat_videos(paths: list, target, threshold: float = 8.0) -> Path:
+    """
+    Склеивает видео через concat demuxer без перекодирования.
+
+    Перед склейкой проверяется, что у частей одинаковые кодек, размер
+    и частота кадров, после - что число кадров результата равно сумме
+    частей. На стыках сравниваются последний кадр части и первый кадр
+    следующей: большая разница означает, что состояние сцены на границе
+    не совпало (например, из-за случайности в construct), и склейка
+    не выполняется.
+
+    Args:
+        paths: части по порядку
+        target: итоговый файл
+        threshold: допустимая средняя разница кадров на стыке (0-255)
+
+    Returns:
+        Path: путь к итоговому файлу
+
+    Raises:
+        ChunkSeamError: скачок изображения на стыке частей
+    """
+    import subprocess
+    import tempfile
+
+    target = Path(target)
+    probes = [probe_video(path) for path in paths]
+    stream = [(info["codec"], info["width"], info["height"], round(info["fps"], 3)) for info in probes]
+    if len(set(stream)) > 1:
+        raise RuntimeError(f"Части видео нельзя склеить без перекодирования: {sorted(set(stream))}")
+
+    for index in range(len(paths) - 1):
+        last = _edge_frame(paths[index], last=True).astype(np.int16)
+        first = _edge_frame(paths[index + 1]).astype(np.int16)
+        difference = float(np.abs(last - first).mean())
+        if difference > threshold:
+            raise ChunkSeamError(f"Скачок изображения на стыке частей {index + 1} и {index + 2}: {difference:.1f}")
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(f".{target.stem}.{os.getpid()}.concat{target.suffix}")
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as file_list:
+        for path in paths:
+            file_list.write("file '{}'\n".format(str(Path(path).resolve()).replace("'", "'\\''")))
+    try:
+        cmd = [
+            'ffmpeg', '-v', 'error',
+            '-f', 'concat', '-safe', '0', '-i', file_list.name,
+            '-c', 'copy',
+            '-movflags', '+faststart',
+            '-y', str(tmp_path)
+        ]
+        with stage("ffmpeg_concat", inputs=paths) as record:
+            subprocess.run(cmd, check=True)
+            record["outputs"].append(tmp_path)
+    finally:
+        os.remove(file_list.name)
+
+    frames = probe_video(tmp_path)["frames"]
+    expected = sum(info["frames"] for info in probes)
+    if frames != expected:
+        os.remove(tmp_path)
+        raise RuntimeError(f"После склейки {frames} кадров вместо {expected}")
+    os.replace(tmp_path, target)
+    return target
+
+
+def render_scene_chunked(scene, quality: str = "l", chunks: int = 0, threads: int = 2,
+                         media_dir=None, output_file=None) -> Path:
+    """
+    Рендерит длинную сцену частями в нескольких процессах.
+
+    Анимации делятся на диапазоны примерно равной длительности, каждый
+    диапазон рендерится отдельным процессом (`manim -n first,last`:
+    предыдущие анимации выполняются без растеризации), а готовые части
+    склеиваются без перекодирования (см. concat_videos). Если на стыке
+    состояние сцены не совпало, сцена рендерится заново одним процессом.
+
+    Args:
+        scene: класс сцены Manim
+        quality: качество рендеринга ('l', 'm', 'h', 'p', 'k')
+        chunks: число частей (0 - по числу ядер / threads)
+        threads: потоков ffmpeg на один процесс
+        media_dir: медиа директория Manim (по умолчанию MEDIA_DIR)
+        output_file: имя итогового файла без расширения (по умолчанию своё для процесса:
+                     параллельные задачи с одной сценой не должны писать в один файл)
+
+    Returns:
+        Path: путь к склеенному видео в медиа директории
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    media_dir = Path(media_dir or MEDIA_DIR)
+    output_file = output_file or f"{scene.__name__}_{os.getpid()}"
+    if not chunks:
+        chunks = max(1, (os.cpu_count() or 1) // threads)
+    with stage("manim_count"):
+        durations = animation_durations(scene)
+    if len(durations) < 2 or chunks < 2:
+        return render_scene(scene, quality, media_dir=media_dir, output_file=output_file)
+    ranges = split_animations(durations, chunks)
+    print(f"Анимации разбиты на {len(ranges)} частей: {ranges}")
+    _, threads = pool_size(len(ranges), threads)
+
+    with stage("manim_chunks") as record:
+        with ProcessPoolExecutor(max_workers=len(ranges), initializer=_init_worker, initargs=(threads,)) as pool:
+            futures = [
+                pool.submit(_render_chunk, scene, quality, first, last, str(media_dir / f"chunk_{first}"), output_file)
+                for first, last in ranges
+            ]
+            parts = [future.result() for future in futures]
+        record["outputs"] += parts
+
+    target = media_dir / "videos" / f"{output_file}.mp4"
+    try:
+        return concat_videos(parts, target)
+    except ChunkSeamError as e:
+        print(ctext(f"{e}: рендеринг одним процессом", "yellow"))
+        with stage("manim_rerender"):
+            return render_scene(scene, quality, media_dir=media_dir, output_file=output_file)
+    finally:
+        for part in parts:
+            Path(part).unlink(missing_ok=True)
+
+
+_daemon_events = None  # Очередь событий воркера демона (задаётся в _init_daemon_worker)
+
+
+def _scene_ref(scene) -> list:
+    """
+    Описание сцены для другого процесса: [файл модуля, имя класса].
+    По нему воркер загружает свежую версию сцены, не импортируя её здесь.
+    """
+    import inspect
+
+    if isinstance(scene, str):
+        module_name, _, class_name = scene.rpartition(":")
+        return [importlib.util.find_spec(module_name or SCENES_MODULE).origin, class_name]
+    return [inspect.getsourcefile(scene), scene.__name__]
+
+
+def _init_daemon_worker(threads: int, events):
+    """
+    Инициализация воркера демона: Manim импортируется, а шаблон LaTeX
+    компилируется один раз, до первой задачи.
+    """
+    global _daemon_events
+    _init_worker(threads)
+    _daemon_events = events
+
+    from manim import MathTex, tempconfig
+    _install_tex_hook()
+    try:
+        with tempconfig({"tex_dir": str(TEX_CACHE_DIR.resolve()), "no_latex_cleanup": True, "verbosity": "WARNING"}):
+            MathTex("x")
+    except Exception as e:
+        print(ctext(f"Прогрев LaTeX не удался: {e}", "yellow"))
+
+
+def _daemon_job(job_id: int, job: dict, cwd: str):
+    """
+    Выполняет задачу демона в воркере. Этапы и результат отправляются
+    в очередь событий, откуда сервер пересылает их клиенту.
+    """
+    global _stage_listener
+    os.chdir(cwd)
+    _daemon_events.put((job_id, {"event": "started", "pid": os.getpid()}))
+    _stage_listener = lambda record: _daemon_events.put((job_id, {"event": "stage", **record}))
+    file_name, scene_name = job.pop("scene")
+    media_dir = JOBS_DIR / f"daemon_{os.getpid()}"
+    start = time.perf_counter()
+    try:
+        createAnim(**job, scene=_load_scene(file_name, scene_name), media_dir=media_dir, daemon=False)
+        result = {"ok": True, "error": None}
+    except Exception as e:
+        result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        _stage_listener = None
+    _daemon_events.put((job_id, {"event": "result", "seconds": round(time.perf_counter() - start, 3), **result}))
+
+
+def daemon_request(request: dict, on_event=None, socket_path=DAEMON_SOCKET):
+    """
+    Отправляет запрос демону рендеринга и читает его ответы до закрытия соединения.
+
+    Args:
+        request: {'cmd': 'render', 'job': {...}, 'cwd': ...}, {'cmd': 'ping'} или {'cmd': 'stop'}
+        on_event: вызывается с каждым событием (словарём) по мере поступления
+        socket_path: путь к сокету демона
+
+    Returns:
+        dict: последнее событие или None, если демон не запущен
+    """
+    import socket
+
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path))
+    except OSError:
+        sock.close()
+        return None
+
+    event = None
+    with sock, sock.makefile("rwb") as stream:
+        stream.write((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+        stream.flush()
+        for line in stream:
+            event = json.loads(line)
+            if on_event is not None:
+                on_event(event)
+    return event
+
+
+def _print_daemon_event(event: dict):
+    if event["event"] == "queued":
+        print(ctext(f"Задача {event['job']} в очереди демона", "dark_grey"))
+    elif event["event"] == "started":
+        print(ctext(f"Рендеринг в воркере {event['pid']}...", "dark_grey"))
+    elif event["event"] == "stage":
+        print(ctext(f"  {event['stage']}: {event['wall']:.2f} с", "dark_grey"))
+    elif event["event"] == "result":
+        if event["ok"]:
+            print(ctext(f"Готово за {event['seconds']:.2f} с (демон)", "green"))
+        else:
+            print(ctext(f"Ошибка: {event['error']}", "red"))
+
+
+def serve(workers: int = 0, threads: int = 2, socket_path=DAEMON_SOCKET):
+    """
+    Демон рендеринга: держит пул прогретых процессов (Manim импортирован,
+    LaTeX уже запускался) и принимает задачи по Unix сокету. Каждое
+    соединение - одна задача; клиенту по строкам JSON приходят события
+    queued, started, stage (по одному на этап) и result.
+
+    createAnim сам отправляет задачи демону, если тот запущен. Если воркер
+    умирает (пул сломан), пул пересоздаётся, а клиенты его задач получают
+    событие unavailable и рендерят сами.
+
+    Args:
+        workers: число процессов (0 - по числу ядер / threads)
+        threads: потоков ffmpeg на один процесс
+        socket_path: путь к сокету
+    """
+    import itertools
+    import multiprocessing
+    import queue
+    import socketserver
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    if daemon_request({"cmd": "ping"}, socket_path=socket_path) is not None:
+        print(ctext(f"Демон уже запущен: {socket_path}", "yellow"))
+        return
+    Path(socket_path).parent.mkdir(parents=True, exist_ok=True)
+    Path(socket_path).unlink(missing_ok=True)  # Сокет от завершившегося демона
+
+    workers, threads = pool_size(workers, threads)
+    job_ids = itertools.count(1)
+    inboxes = {}
+    inboxes_lock = threading.Lock()
+
+    def dispatch(events):
+        while True:
+            job_id, event = events.get()
+            if job_id is None:
+                break
+            with inboxes_lock:
+                inbox = inboxes.get(job_id)
+            if inbox is not None:
+                inbox.put(event)
+
+    def start_pool():
+        # У каждого пула своя очередь событий: упавший воркер мог умереть, держа её блокировку
+        events = multiprocessing.Queue()
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_daemon_worker, initargs=(threads, events))
+        for _ in range(workers):
+            pool.submit(time.sleep, 0)  # Запускаем и прогреваем воркеры сразу, а не к первой задаче
+        dispatcher = threading.Thread(target=dispatch, args=(events,), daemon=True)
+        dispatcher.start()
+        return pool, events, dispatcher
+
+    pools = [start_pool()]  # Текущий пул (заменяется, если сломан)
+    pools_lock = threading.Lock()
+
+    def restart_pool(broken):
+        with pools_lock:
+            pool, events, _ = pools[0]
+            if pool is broken:
+                pool.shutdown(wait=False, cancel_futures=True)
+                events.cancel_join_thread()
+                pools[0] = start_pool()
+                print(ctext("Воркер демона упал, пул процессов пересоздан", "yellow"))
+
+    class Handler(socketserver.StreamRequestHandler):
+        def send(self, event: dict):
+            self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            if request["cmd"] == "ping":
+                self.send({"event": "pong", "workers": workers, "pid": os.getpid()})
+                return
+            if request["cmd"] == "stop":
+                self.send({"event": "stopping"})
+                threading.Thread(target=server.shutdown).start()
+                return
+
+            job_id = next(job_ids)
+            inbox = queue.Queue()
+            with inboxes_lock:
+                inboxes[job_id] = inbox
+            def on_done(future):
+                # Если воркер упал, событие result из него уже не придёт
+                error = future.exception()
+                if isinstance(error, BrokenProcessPool):
+                    inbox.put({"event": "unavailable", "error": repr(error)})
+                elif error is not None:
+                    inbox.put({"event": "result", "ok": False, "seconds": 0.0, "error": repr(error)})
+
+            try:
+                self.send({"event": "queued", "job": job_id})
+                pool = pools[0][0]
+                try:
+                    future = pool.submit(_daemon_job, job_id, request["job"], request["cwd"])
+                except BrokenProcessPool:
+                    restart_pool(pool)
+                    pool = pools[0][0]
+                    future = pool.submit(_daemon_job, job_id, request["job"], request["cwd"])
+                future.add_done_callback(on_done)
+                while True:
+                    event = inbox.get()
+                    if event["event"] == "unavailable":
+                        restart_pool(pool)
+                    self.send(event)
+                    if event["event"] in ("result", "unavailable"):
+                        break
+            except BrokenPipeError:
+                pass  # Клиент отключился, задача доработает без него
+            finally:
+                with inboxes_lock:
+                    inboxes.pop(job_id, None)
+
+    server = socketserver.ThreadingUnixStreamServer(str(socket_path), Handler)
+    server.daemon_threads = True
+    print(ctext(f"Демон рендеринга: {socket_path}, процессов: {workers}, потоков на процесс: {threads}",
+                "cyan", "bold"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        Path(socket_path).unlink(missing_ok=True)
+        pool, events, dispatcher = pools[0]
+        pool.shutdown(cancel_futures=True)
+        events.put((None, None))
+        dispatcher.join(timeout=1)
+        print("Демон остановлен")
+
+
+FORMULA_TEMPLATE = r"""\documentclass{article}
+\usepackage{amsmath}
+\usepackage{amssymb}
+\usepackage{xcolor}
+\usepackage[active,tightpage]{preview}
+\pagestyle{empty}
+\begin{document}
+\color{COLOR}
+BODY
+\end{document}
+"""
+
+
+def formula_key(tex: str, dpi: int = 300, color: str = "white") -> str:
+    """
+    Ключ кэша формулы: хэш её LaTeX кода и настроек растеризации.
+    """
+    import hashlib
+
+    return hashlib.sha256(f"{tex}|{dpi}|{color}|{FORMULA_TEMPLATE}".encode("utf-8")).hexdigest()
+
+
+def _compile_formulas(formulas: dict, dpi: int, color: str) -> None:
+    """
+    Компилирует формулы {ключ: LaTeX} одним запуском LaTeX, dvipng и dvisvgm
+    и публикует страницы в FORMULA_CACHE_DIR под их ключами.
+
+    Raises:
+        RuntimeError: одна из программ завершилась с ошибкой
+    """
+    import subprocess
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        work = Path(work_dir)
+        body = "\n".join(f"\\begin{{preview}}$\\displaystyle {tex}$\\end{{preview}}" for tex in formulas.values())
+        (work / "batch.tex").write_text(
+            FORMULA_TEMPLATE.replace("COLOR", color).replace("BODY", body), encoding="utf-8"
+        )
+        commands = [
+            ['latex', '-interaction=nonstopmode', '-halt-on-error', 'batch.tex'],
+            ['dvipng', '-q', '-T', 'tight', '-bg', 'Transparent', '-D', str(dpi), '-o', 'page-%d.png', 'batch.dvi'],
+            ['dvisvgm', '--page=1-', '--no-fonts', '--exact-bbox', '-v', '0', '-o', 'page-%p.svg', 'batch.dvi'],
+        ]
+        for cmd in commands:
+            result = subprocess.run(cmd, cwd=work, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"Ошибка {cmd[0]}:\n{(result.stdout + result.stderr)[-2000:]}")
+
+        for suffix in (".png", ".svg"):
+            # dvisvgm дополняет номер нулями (page-01 ... page-10), поэтому сортируем по числу
+            pages = sorted(work.glob(f"page-*{suffix}"), key=lambda path: int(path.stem.partition("-")[2]))
+            if len(pages) != len(formulas):
+                raise RuntimeError(f"Страниц {suffix}: {len(pages)}, формул: {len(formulas)}")
+            for page, key in zip(pages, formulas):
+                publish(page, FORMULA_CACHE_DIR / f"{key}{suffix}", move=True)
+
+
+def render_formulas(formulas, outpath: str = "media/math", dpi: int = 300, color: str = "white",
+                    formats=(".png", ".svg")) -> dict:
+    """
+    Рендерит много формул за один запуск LaTeX, dvipng и dvisvgm.
+
+    Каждая формула - отдельная страница документа (пакет preview, плотная
+    рамка). Страницы разбиваются на прозрачные PNG и SVG, которые кэшируются
+    по хэшу формулы, так что компилируются только новые формулы.
+
+    Args:
+        formulas: список строк LaTeX или словарь {имя файла: LaTeX}
+                  (для списка имя - начало хэша формулы)
+        outpath: папка для результатов
+        dpi: разрешение PNG
+        color: цвет формул (имя цвета xcolor)
+        formats: какие файлы публиковать в outpath ('.png', '.svg')
+
+    Returns:
+        dict: {имя: Path к первому из formats}
+
+    Raises:
+        RuntimeError: какие-то формулы не компилируются (остальные при этом кэшируются)
+    """
+    if not isinstance(formulas, dict):
+        formulas = {formula_key(tex, dpi, color)[:12]: tex for tex in formulas}
+    target_dir = Path(outpath)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    FORMULA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+    keys = {name: formula_key(tex, dpi, color) for name, tex in formulas.items()}
+    missing = {}
+    for name, key in keys.items():
+        if not (FORMULA_CACHE_DIR / f"{key}.png").is_file():
+            missing.setdefault(key, formulas[name])
+    print(f"Формул: {len(formulas)}, компилируется: {len(missing)}")
+
+    if missing:
+        try:
+            _compile_formulas(missing, dpi, color)
+        except RuntimeError:
+            if len(missing) == 1:
+                raise
+            # Одна ошибка останавливает весь пакет: компилируем по одной, чтобы
+            # сохранить в кэше правильные формулы и назвать неправильные
+            failed = []
+            for key, tex in missing.items():
+                try:
+                    _compile_formulas({key: tex}, dpi, color)
+                except RuntimeError as e:
+                    names = ", ".join(name for name, name_key in keys.items() if name_key == key)
+                    failed.append(f"{names}: {tex}\n{e}")
+            if failed:
+                raise RuntimeError(f"Не компилируются формулы ({len(failed)}):\n\n" + "\n\n".join(failed))
+
+    results = {}
+    for name, key in keys.items():
+        for suffix in formats:
+            cache_restore(FORMULA_CACHE_DIR / f"{key}{suffix}", target_dir / f"{name}{suffix}")
+        results[name] = target_dir / f"{name}{formats[0]}"
+    return results
+
+
+MEDIA_REF = re.compile(r"""(?:src=["']|\]\()/?media/([^"')\s]+)""")
+
+
+def find_media_refs(root: str = ".") -> dict:
+    """
+    Находит все ссылки на media/ в .md файлах.
+
+    Args:
+        root: папка с документацией
+
+    Returns:
+        dict: {путь относительно media/: [md файлы, которые на него ссылаются]}
+    """
+    refs = {}
+    for md_file in sorted(Path(root).glob("*.md")):
+        for match in MEDIA_REF.finditer(md_file.read_text(encoding="utf-8")):
+            refs.setdefault(match.group(1), []).append(md_file.name)
+    return refs
+
+
+def build(root: str = ".", quality: str = "h", workers: int = 1, threads: int = 2) -> list[str]:
+    """
+    Собирает только те медиа файлы, на которые ссылаются .md документы
+    и которые отсутствуют или устарели (как make).
+
+    Файл устарел, если ключ, с которым он был опубликован, не совпадает
+    с текущим ключом сцены (см. render_key).
+
+    Args:
+        root: папка с документацией
+        quality: качество рендеринга по умолчанию
+        workers: число процессов (1 - рендерить в текущем процессе)
+        threads: потоков ffmpeg на процесс
+
+    Returns:
+        list[str]: файлы в media/, на которые никто не ссылается
+    """
+    media_root = Path(root) / "media"
+    refs = find_media_refs(root)
+    jobs = []
+    formulas = {}
+
+    for ref, md_files in refs.items():
+        target = media_root / ref
+        spec = BUILD_TARGETS.get(ref)
+        if spec is None:
+            if not target.exists():
+                print(ctext(f"Нет описания сцены для {ref} ({', '.join(md_files)})", "red"))
+            continue
+
+        job_quality = spec.get("quality", quality)
+        if "tex" in spec:
+            key = formula_key(spec["tex"])
+        else:
+            key = output_key(resolve_scene(spec["scene"]), target.suffix, job_quality,
+                             spec.get("crop"), spec.get("max_bytes"))
+        if target.exists() and recorded_key(target) == key:
+            print(ctext(f"Актуален: {ref}", "dark_grey"))
+            continue
+
+        print(ctext(f"Устарел: {ref}" if target.exists() else f"Отсутствует: {ref}", "yellow"))
+        if "tex" in spec:
+            # Формулы одной папки собираются одним запуском LaTeX
+            formulas.setdefault((str(target.parent), target.suffix), {})[target.stem] = spec["tex"]
+            continue
+        jobs.append({
+            "formula_name": target.stem,
+            "outpath": str(target.parent),
+            "scene": spec["scene"],
+            "image_mode": target.suffix == ".png",
+            "video_mode": target.suffix == ".mp4",
+            "quality": job_quality,
+            "crop": spec.get("crop"),
+            "loop_format": next((name for name, suffix in LOOP_FORMATS.items() if suffix == target.suffix), None),
+            "loop_max_bytes": spec.get("max_bytes"),
+        })
+
+    for (outpath, suffix), batch in formulas.items():
+        render_formulas(batch, outpath=outpath, formats=(suffix,))
+    if jobs and workers > 1:
+        render_jobs(jobs, workers=workers, threads=threads)
+    else:
+        for job in jobs:
+            createAnim(**job)
+    built = len(jobs) + sum(len(batch) for batch in formulas.values())
+    print(ctext(f"Собрано: {built}, всего ссылок: {len(refs)}", "green", "bold"))
+
+    # Файлы, на которые никто не ссылается (кандидаты на удаление)
+    service_dirs = {".cache", "jobs", "preview", "videos", "images", "Tex", "texts"}
+    unreferenced = []
+    for path in sorted(media_root.rglob("*")):
+        rel = path.relative_to(media_root)
+        if path.is_file() and rel.parts[0] not in service_dirs and rel.as_posix() not in refs:
+            unreferenced.append(rel.as_posix())
+    for rel in unreferenced:
+        print(ctext(f"Не используется: media/{rel}", "purple"))
+    return unreferenced
+
+
+def _load_scene(file_name: str, scene_name: str):
+    """
+    Загружает модуль со сценой заново (с учётом последних правок) и возвращает класс сцены.
+
+    Модуль регистрируется в sys.modules под постоянным для файла именем:
+    без этого inspect не находит исходный код сцены (render_key, _scene_ref).
+    Повторная загрузка того же файла заменяет прежнюю запись, поэтому
+    режим наблюдения и демон не накапливают старые версии модуля.
+    Код компилируется из исходника, минуя __pycache__: .pyc проверяется по
+    mtime с точностью до секунды и мог бы пропустить быструю правку.
+    """
+    import hashlib
+
+    path = os.path.abspath(file_name)
+    name = f"_watched_{hashlib.sha1(path.encode('utf-8')).hexdigest()[:12]}"
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    previous = sys.modules.get(name)
+    sys.modules[name] = module
+    try:
+        exec(compile(Path(path).read_bytes(), path, "exec"), module.__dict__)
+    except BaseException:
+        if previous is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = previous  # Ошибка в файле: прежняя версия остаётся рабочей
+        raise
+    return getattr(module, scene_name)
+
+
+def _render_fresh(specs: list, done=None):
+    """
+    Процесс фонового рендеринга: загружает свежие версии сцен и рендерит
+    задачи в итоговом качестве.
+
+    Args:
+        specs: [(номер задачи, файл, имя сцены, аргументы createAnim)]
+        done: общий массив флагов, в котором отмечаются готовые задачи
+    """
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()  # Своя группа процессов: _stop_background остановит и пул render_scene_chunked
+    for number, file_name, scene_name, job in specs:
+        createAnim(**job, scene=_load_scene(file_name, scene_name))
+        if done is not None:
+            done[number] = 1
+    print(ctext("Фоновый рендеринг завершён", "green", "bold"))
+
+
+def _stop_background(process) -> None:
+    """
+    Останавливает фоновый рендер watch вместе с его дочерними процессами.
+    """
+    import signal
+
+    if not process.is_alive():
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        process.terminate()  # Нет групп процессов или она ещё не создана
+    process.join()
+
+
+def watch(jobs: list[dict], interval: float = 0.2, debounce: float = 0.3):
+    """
+    Режим наблюдения: следит за файлами сцен и после каждого сохранения
+    сразу делает превью низкого качества в PREVIEW_DIR, а итоговый рендер
+    запускает в фоновом процессе. Если файл снова меняется, фоновый рендер
+    прерывается и запускается заново: с новыми версиями изменённых сцен и
+    с ещё не готовыми задачами остальных файлов.
+
+    Args:
+        jobs: задачи - словари с аргументами createAnim (как в render_jobs)
+        interval: как часто проверять файлы, в секундах
+        debounce: сколько ждать, пока файл перестанет меняться, в секундах
+    """
+    import inspect
+    import multiprocessing
+
+    specs = []
+    for job in jobs:
+        job = dict(job)
+        scene = resolve_scene(job.pop("scene"))
+        specs.append((inspect.getsourcefile(scene), scene.__name__, job))
+    files = {file_name for file_name, _, _ in specs}
+
+    def snapshot():
+        return {file_name: os.stat(file_name).st_mtime_ns for file_name in files}
+
+    # Флаги в общей памяти, а не очередь: фоновый процесс прерывается terminate(),
+    # и очередь могла бы остаться повреждённой
+    done = multiprocessing.Array("b", len(specs), lock=False)
+    pending = set()  # Номера задач, итоговый рендер которых ещё не готов
+    mtimes = snapshot()
+    background = None
+    print(ctext(f"Наблюдение за: {', '.join(sorted(files))} (Ctrl+C - выход)", "cyan", "bold"))
+    try:
+        while True:
+            time.sleep(interval)
+            current = snapshot()
+            if current == mtimes:
+                continue
+
+            # Ждём, пока файл перестанет меняться (редактор может писать его в несколько приёмов)
+            while True:
+                time.sleep(debounce)
+                stable = snapshot()
+                if stable == current:
+                    break
+                current = stable
+            changed = {file_name for file_name in files if current[file_name] != mtimes[file_name]}
+            mtimes = current
+
+            if background is not None and background.is_alive():
+                _stop_background(background)
+                print(ctext("Фоновый рендеринг прерван", "yellow"))
+            pending = {number for number in pending if not done[number]}
+
+            # Превью низкого качества прямо в этом процессе
+            for file_name in sorted(changed):
+                affected = [number for number, spec in enumerate(specs) if spec[0] == file_name]
+                pending.update(affected)
+                for number in affected:
+                    _, scene_name, job = specs[number]
+                    start = time.perf_counter()
+                    try:
+                        preview = {**job, "outpath": str(PREVIEW_DIR), "quality": "l"}
+                        createAnim(**preview, scene=_load_scene(file_name, scene_name))
+                        print(ctext(f"Превью {job['formula_name']}: {time.perf_counter() - start:.2f} с", "green"))
+                    except Exception as e:
+                        print(ctext(f"Ошибка в {scene_name}: {e}", "red"))
+                        pending.difference_update(affected)  # Файл с ошибкой ждёт следующего сохранения
+                        break
+
+            # Итоговое качество - в фоне, вместе с прерванными задачами других файлов
+            if pending:
+                queued = [(number, *specs[number]) for number in sorted(pending)]
+                for number in pending:
+                    done[number] = 0
+                # Не daemon: иначе render_scene_chunked (chunks > 1) не сможет запустить свой пул
+                background = multiprocessing.Process(target=_render_fresh, args=(queued, done))
+                background.start()
+    except KeyboardInterrupt:
+        print("Наблюдение остановлено")
+    finally:
+        if background is not None:
+            _stop_background(background)
+
+
+def _pid_alive(pid: str) -> bool:
+    """
+    Процесс с номером pid (строка из имени файла) ещё работает.
+    """
+    if not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Процесс есть, но принадлежит другому пользователю
+    return True
+
+
+def _daemon_dir_in_use(path: Path) -> bool:
+    """
+    Директория воркера демона (JOBS_DIR/daemon_<pid>), процесс которого ещё работает.
+    """
+    prefix, _, pid = path.name.partition("_")
+    return prefix == "daemon" and _pid_alive(pid)
+
+
+def cleanup():    
+    """
+    Функция для очистки временных файлов, созданных Manim.
+    Кэши media/.cache не удаляются, а ужимаются до своих бюджетов
+    (TEX_CACHE_BUDGET, PARTIAL_CACHE_BUDGET, OUTPUT_CACHE_BUDGET, FORMULA_CACHE_BUDGET).
+    Директории работающих воркеров демона в media/jobs не удаляются,
+    а из media/.cache/partial_jobs удаляются только директории убитых процессов.
+    """
+    import shutil
+
+    with stage("cleanup"):
+        # Очистка временных файлов
+        cleanup_dirs = ["videos", "images", "Tex", "texts", "jobs", "preview"]
+        for dir_path in cleanup_dirs:
+            dir_path = Path(f"media/{dir_path}")
+            if not dir_path.exists():
+                continue
+            if dir_path == JOBS_DIR:
+                # Воркеры работающего демона пишут в свои директории - их оставляем
+                for job_dir in dir_path.iterdir():
+                    if not _daemon_dir_in_use(job_dir):
+                        shutil.rmtree(job_dir)
+            else:
+                shutil.rmtree(dir_path)
+            print(f"Очищена директория: {dir_path}")
+
+        # Служебные файлы LaTeX не нужны для повторного использования формул
+        if TEX_CACHE_DIR.exists():
+            for pattern in ("*.log", "*.aux"):
+                for path in TEX_CACHE_DIR.glob(pattern):
+                    path.unlink(missing_ok=True)
+        # Отрезки рендеров, процесс которых убит (например, прерванный фоновый рендер watch)
+        if PARTIAL_JOBS_DIR.exists():
+            for job_dir in PARTIAL_JOBS_DIR.iterdir():
+                if not _pid_alive(job_dir.name.partition("_")[0]):
+                    shutil.rmtree(job_dir, ignore_errors=True)
+        tex_cache_evict()
+        partial_cache_evict()
+        output_cache_evict()
+
+
+def _add_pool_args(parser, workers: int = 0):
+    parser.add_argument("--workers", type=int, default=workers, help="число процессов (0 - по числу ядер / threads)")
+    parser.add_argument("--threads", type=int, default=2, help="потоков ffmpeg на один процесс")
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Рендеринг сцен Manim и постобработка медиа для документации")
+    parser.add_argument("--report", action="store_true", help="печатать время этапов (JSONL отчёт пишется всегда)")
+    parser.add_argument("--clean", action="store_true", help="после render/build удалить временные файлы Manim")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render = commands.add_parser("render", help="отрендерить сцену (или задачи из манифеста)")
+    render.add_argument("scene", nargs="?", default="Formula",
+                        help=f"имя сцены из {SCENES_MODULE}.py или 'модуль:Класс'")
+    render.add_argument("-n", "--name", default="anim1", help="имя выходного файла")
+    render.add_argument("-o", "--out", default="media/manim", help="папка для результатов")
+    render.add_argument("-q", "--quality", default="h", choices=list(QUALITY_NAMES))
+    render.add_argument("--image", action="store_true", help="рендерить одиночное изображение")
+    render.add_argument("--video", action=argparse.BooleanOptionalAction, default=True,
+                        help="рендерить видео (по умолчанию; --no-video - только изображение или --loop)")
+    render.add_argument("--crop", nargs=4, type=int, metavar=("L", "T", "R", "B"), help="отступы обрезки видео")
+    render.add_argument("--auto-crop", action="store_true", help="обрезать по содержимому в том же проходе")
+    render.add_argument("--loop", choices=list(LOOP_FORMATS), help="зацикленная анимация")
+    render.add_argument("--loop-max-bytes", type=int, help="предельный размер зацикленной анимации в байтах")
+    render.add_argument("--no-cache", dest="cache", action="store_false", help="не использовать кэш результатов")
+    render.add_argument("--chunks", type=int, default=1,
+                        help="рендерить видео частями в нескольких процессах (0 - по числу ядер)")
+    render.add_argument("--manifest", help="JSON файл со списком задач (аргументы createAnim)")
+    render.add_argument("--watch", action="store_true", help="быстрое превью при сохранении + итоговый рендер в фоне")
+    render.add_argument("--no-daemon", dest="daemon", action="store_false",
+                        help="рендерить в этом процессе, даже если демон запущен")
+    _add_pool_args(render)
+
+    crop = commands.add_parser("crop", help="обрезать видео (файл, папку или шаблон)")
+    crop.add_argument("source")
+    crop.add_argument("--offset", nargs=4, type=int, default=[0, 0, 0, 0], metavar=("L", "T", "R", "B"),
+                      help="смещение границ: left, top, right, bottom")
+    crop.add_argument("--auto", action="store_true", help="добавить к смещению найденные чёрные поля")
+    crop.add_argument("--sample-frames", type=int, default=0, help="кадров для поиска полей (0 - все)")
+    crop.add_argument("--encoder", default="default", choices=list(ENCODER_PRESETS))
+    crop.add_argument("--replace", action="store_true", help="заменить исходный файл")
+    _add_pool_args(crop)
+
+    detect = commands.add_parser("detect-borders", help="найти чёрные поля видео")
+    detect.add_argument("video")
+    detect.add_argument("--sample-frames", type=int, default=0)
+    detect.add_argument("--threshold", type=int, default=10)
+
+    build_cmd = commands.add_parser("build", help="собрать медиа, на которые ссылаются .md (см. BUILD_TARGETS)")
+    build_cmd.add_argument("--root", default=".")
+    build_cmd.add_argument("-q", "--quality", default="h", choices=list(QUALITY_NAMES))
+    _add_pool_args(build_cmd, workers=1)
+
+    daemon = commands.add_parser("daemon", help="запустить демон рендеринга с прогретыми процессами")
+    daemon.add_argument("--status", action="store_true", help="проверить, запущен ли демон")
+    daemon.add_argument("--stop", action="store_true", help="остановить запущенный демон")
+    _add_pool_args(daemon)
+
+    commands.add_parser("clean", help="удалить временные файлы и ужать кэши")
+    commands.add_parser("stats", help="статистика кэша LaTeX")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    """
+    Точка входа командной строки:
+
+        python -m render_math render Formula -n anim1 --auto-crop
+        python -m render_math render --manifest jobs.json --workers 4 --clean
+        python -m render_math crop media/manim --auto --replace
+        python -m render_math detect-borders media/manim/anim1.mp4
+        python -m render_math build
+        python -m render_math daemon --workers 2   # дальше render идёт через демон
+        python -m render_math clean
+
+    Manim, numpy, PIL и тяжёлые модули стандартной библиотеки импортируются
+    только функциями, которым они нужны. `python -m render_math` запускается
+    из кэша байт-кода, а `python render_math.py` каждый раз компилирует файл
+    заново - это в несколько раз медленнее для коротких команд вроде --help.
+    """
+    global REPORT_SUMMARY
+    args = _parse_args(argv)
+    REPORT_SUMMARY = args.report
+    failed = False
+
+    if args.command == "render":
+        crop = "auto" if args.auto_crop else args.crop
+        if args.manifest:
+            jobs = json.loads(Path(args.manifest).read_text(encoding="utf-8"))
+        else:
+            jobs = [{
+                "formula_name": args.name, "outpath": args.out, "scene": args.scene,
+                "image_mode": args.image, "video_mode": args.video, "quality": args.quality, "crop": crop,
+                "use_cache": args.cache, "loop_format": args.loop, "loop_max_bytes": args.loop_max_bytes,
+                "chunks": args.chunks,
+            }]
+        if args.watch:
+            watch(jobs)
+        elif len(jobs) > 1:
+            failed = not all(result["ok"] for result in render_jobs(jobs, workers=args.workers, threads=args.threads))
+        else:
+            createAnim(**jobs[0], daemon=args.daemon)
+    elif args.command == "crop":
+        if os.path.isfile(args.source):
+            offset = args.offset
+            if args.auto:
+                borders = find_black_borders(args.source, sample_frames=args.sample_frames)
+                offset = [a + b for a, b in zip(offset, borders)]
+            failed = crop_video(args.source, offset, replace_original=args.replace, encoder=args.encoder) is None
+        elif args.auto:
+            print(ctext("--auto работает только с одним файлом", "red"))
+            failed = True
+        else:
+            results = crop_videos(args.source, args.offset, replace_original=args.replace, encoder=args.encoder,
+                                  workers=args.workers, threads=args.threads)
+            failed = any(result["status"] == "failed" for result in results)
+    elif args.command == "detect-borders":
+        print(find_black_borders(args.video, sample_frames=args.sample_frames, threshold=args.threshold))
+    elif args.command == "build":
+        build(args.root, quality=args.quality, workers=args.workers, threads=args.threads)
+    elif args.command == "daemon":
+        if args.status or args.stop:
+            event = daemon_request({"cmd": "stop" if args.stop else "ping"})
+            if event is None:
+                print("Демон не запущен")
+                failed = args.status
+            elif args.status:
+                print(f"Демон запущен: pid {event['pid']}, процессов: {event['workers']}")
+        else:
+            serve(workers=args.workers, threads=args.threads)
+    elif args.command == "stats":
+        tex_cache_stats()
+
+    if args.command == "clean" or (args.clean and args.command in ("render", "build")):
+        cleanup()
+    if _stages:
+        write_report(args.command)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+from manim import *  # type: ignore
+
+
+class Formula(Scene):
+    def construct(self):
+        circle = Circle()  # создать обьект
+        circle.set_fill(BLUE, opacity=0.5)  # устаноить цвет и прозрачность
+
+        square = Square()
+        square.shift(2 * LEFT) # переместить
+        square.rotate(PI/4) # повернуть обьект
+
+        circle.next_to(square, RIGHT, buff=0.5)  # позиция справа от квадрата
+
+        self.play(Create(circle), Create(square))  # показать фигуры
+        self.play(square.animate.rotate(PI/4))  # анимация поворота
+        Wait(1) # пауза
+        self.play(Rotate(square, angle=PI)) # другая анимация поворота
+
+
+class TwoTransforms(Scene):
+    def transform(self):
+        a = Circle()
+        b = Square()
+        c = Triangle()
+        self.play(Transform(a, b))
+        self.play(Transform(a, c))
+        self.play(FadeOut(a))
+
+    def replacement_transform(self):
+        a = Circle()
+        b = Square()
+        c = Triangle()
+        self.play(ReplacementTransform(a, b))
+        self.play(ReplacementTransform(b, c))
+        self.play(FadeOut(c))
+
+    def construct(self):
+        self.transform()
+        self.wait(0.5)  # wait for 0.5 seconds
+        self.replacement_transform()
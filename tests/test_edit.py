@@ -0,0 +1,280 @@
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+if sys.version_info < (3, 12):
+    pytest.skip("Архив/static/edit.py требует Python 3.12", allow_module_level=True)
+
+EDIT_PATH = Path(__file__).resolve().parent.parent / "Архив" / "static" / "edit.py"
+spec = importlib.util.spec_from_file_location("edit", EDIT_PATH)
+edit = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(edit)
+
+
+def document(version: int) -> dict:
+    return {"basics": {"name": "Основы", "id": "basics", "content": {
+        "post1": {"title": f"Версия {version}", "id": "post1", "explanation": "Текст", "parameters": [], "code": []},
+    }}}
+
+
+def test_backup_prune_does_not_rewrite_index_on_every_save(tmp_path, monkeypatch):
+    store = edit.BackupStore(str(tmp_path / "backups"))
+    rewrites = []
+    replace = os.replace
+
+    def counting_replace(source, target):
+        if target == store.index_path:
+            rewrites.append(target)
+        replace(source, target)
+
+    monkeypatch.setattr(edit.os, "replace", counting_replace)
+    saves = 100
+    for version in range(saves):
+        assert store.save("doc.json", document(version)) is not None
+
+    # Все снимки в пределах одного часа: политика оставляет KEEP_LAST последних
+    assert 1 <= len(rewrites) <= saves // store.PRUNE_EVERY
+    assert len(store.snapshots("doc.json")) <= store.KEEP_LAST + store.PRUNE_EVERY
+    assert store.load(store.find("doc.json")["manifest"]) == document(saves - 1)
+
+
+def test_backup_index_is_reread_after_external_append(tmp_path):
+    first = edit.BackupStore(str(tmp_path / "backups"))
+    second = edit.BackupStore(str(tmp_path / "backups"))
+    first.save("a.json", document(1))
+    second.save("b.json", document(2))
+
+    assert [entry["file"] for entry in first.snapshots("b.json")] == ["b.json"]
+
+
+def write_document(tmp_path, version: int = 1) -> str:
+    path = tmp_path / "doc.json"
+    path.write_text(json.dumps(document(version), ensure_ascii=False, indent=4), encoding="utf-8")
+    return str(path)
+
+
+class TrackedLock:
+    """
+    Блокировка, которая сообщает, что её взял поток с именем thread_name.
+    """
+    def __init__(self, lock, thread_name: str):
+        self.lock = lock
+        self.thread_name = thread_name
+        self.taken = threading.Event()
+
+    def __enter__(self):
+        self.lock.acquire()
+        if threading.current_thread().name == self.thread_name:
+            self.taken.set()
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+def test_restore_during_compaction_does_not_deadlock(tmp_path):
+    handler = edit.JsonHandler(write_document(tmp_path))
+    handler._compact_lock = TrackedLock(handler._compact_lock, "compactor")
+    find = handler.backups.find
+
+    def find_while_compacting(name, when=None):
+        # Фоновая перезапись начинается, пока restore держит свои блокировки
+        threading.Thread(target=handler.pushJson, name="compactor", daemon=True).start()
+        handler._compact_lock.taken.wait(timeout=1)
+        return find(name, when)
+
+    handler.backups.find = find_while_compacting
+    restore = threading.Thread(target=handler.restore, args=(time.time(),), daemon=True)
+    restore.start()
+    restore.join(timeout=10)
+    if restore.is_alive():
+        edit.atexit.unregister(handler.close)  # close ждал бы ту же блокировку при выходе
+
+    assert not restore.is_alive(), "restore и фоновая перезапись ждут друг друга"
+    handler.close()
+
+
+def crash(handler):
+    """
+    Процесс упал: журнал не перенесён в файл и не удалён.
+    """
+    edit.atexit.unregister(handler.close)
+    handler._journal_file.close()
+
+
+def test_journal_replay_after_crash(tmp_path):
+    path = write_document(tmp_path)
+    handler = edit.JsonHandler(path)
+    handler.createSection("Продвинутое", "advanced")
+    handler.createPost("advanced", "Заголовок", "post2", "Текст")
+    handler.createParameter("advanced", "post2", "name", "description")
+    crash(handler)
+
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) == document(1)  # Файл не перезаписывался, правки только в журнале
+    with edit.JsonHandler(path) as recovered:
+        assert recovered["advanced"]["content"]["post2"]["parameters"] == [{"name": "name", "description": "description"}]
+    assert not os.path.exists(path + ".journal")
+
+
+def test_pending_journal_already_in_file_is_not_replayed(tmp_path, monkeypatch):
+    path = write_document(tmp_path)
+    handler = edit.JsonHandler(path)
+    handler.createParameter("basics", "post1", "name", "description")
+    remove = os.remove
+    # Сбой после перезаписи файла, но до удаления отложенного журнала
+    monkeypatch.setattr(edit.os, "remove", lambda target: None if target == handler.pending_path else remove(target))
+    handler.pushJson()
+    monkeypatch.undo()
+    crash(handler)
+
+    assert os.path.exists(handler.pending_path)
+    with edit.JsonHandler(path) as recovered:
+        assert len(recovered["basics"]["content"]["post1"]["parameters"]) == 1  # Хэш базы не совпал: не повторяем
+
+
+def test_pending_journal_missing_from_file_is_replayed(tmp_path, monkeypatch):
+    path = write_document(tmp_path)
+    handler = edit.JsonHandler(path)
+    handler.createParameter("basics", "post1", "name", "description")
+    replace = os.replace
+
+    def crash_on_write(source, target):
+        if target == path:
+            raise OSError("сбой при записи файла")
+        replace(source, target)
+
+    # Сбой после того, как журнал отложен, но до замены файла
+    monkeypatch.setattr(edit.os, "replace", crash_on_write)
+    try:
+        handler.pushJson()
+    except OSError:
+        pass
+    monkeypatch.undo()
+    crash(handler)
+
+    with edit.JsonHandler(path) as recovered:
+        assert len(recovered["basics"]["content"]["post1"]["parameters"]) == 1
+
+
+def test_transaction_rollback_leaves_file_and_journal_untouched(tmp_path):
+    for journal in (True, False):
+        path = write_document(tmp_path)
+        with open(path, "rb") as f:
+            before = f.read()
+        with edit.JsonHandler(path, journal=journal) as handler:
+            journal_size = os.path.getsize(handler.journal_path) if journal else None
+            with pytest.raises(ValueError):
+                with handler.transaction():
+                    handler.createPost("basics", "Заголовок", "post2", "Текст")
+                    handler.createParameter("basics", "missing", "name", "description")  # Нет такого поста
+
+            assert handler.data == document(1)
+            with open(path, "rb") as f:
+                assert f.read() == before
+            if journal:
+                assert os.path.getsize(handler.journal_path) == journal_size
+
+
+def test_torn_transaction_record_is_not_replayed(tmp_path):
+    path = write_document(tmp_path)
+    handler = edit.JsonHandler(path)
+    handler.createSection("Продвинутое", "advanced")
+    with handler.transaction():
+        handler.createPost("basics", "Заголовок", "post2", "Текст")
+        handler.createParameter("basics", "post2", "name", "description")
+    crash(handler)
+    with open(handler.journal_path, "rb+") as f:
+        f.truncate(os.path.getsize(handler.journal_path) - 20)  # Запись транзакции дописана не до конца
+
+    with edit.JsonHandler(path) as recovered:
+        assert "advanced" in recovered.data                          # Запись до транзакции применена
+        assert "post2" not in recovered["basics"]["content"]         # Транзакция - целиком или никак
+
+
+def sqlite_document(tmp_path) -> str:
+    db_path = str(tmp_path / "docs.sqlite")
+    with edit.SqliteHandler(db_path, "doc") as handler:
+        handler.data.update(document(1))
+        handler.pushJson()
+    return db_path
+
+
+def test_sqlite_failed_query_rolls_back_memory(tmp_path, monkeypatch):
+    with edit.SqliteHandler(sqlite_document(tmp_path), "doc") as handler:
+        def broken(*args, **kwargs):
+            raise edit.sqlite3.OperationalError("disk I/O error")
+
+        monkeypatch.setattr(handler, "_sql_createSection", broken)
+        with pytest.raises(edit.sqlite3.OperationalError):
+            handler.createSection("Продвинутое", "advanced")
+
+        assert handler.data == document(1)
+        assert edit.read_sqlite_doc(handler.conn, "doc") == document(1)
+
+
+def test_sqlite_rename_keeps_parameters_and_code(tmp_path):
+    db_path = sqlite_document(tmp_path)
+    with edit.SqliteHandler(db_path, "doc") as handler:
+        handler.createParameter("basics", "post1", "name", "description")
+        handler.createCode("basics", "post1", "python", "print(1)")
+        handler.editSection("basics", "Основы", "intro")
+        handler.editPost("intro", "post1", "Версия 2", "first", "Текст")
+
+    conn = edit.connect_sqlite(db_path)
+    try:
+        data = edit.read_sqlite_doc(conn, "doc")
+    finally:
+        conn.close()
+    post = data["intro"]["content"]["first"]
+    assert list(data) == ["intro"] and list(data["intro"]["content"]) == ["first"]
+    assert post["title"] == "Версия 2"
+    assert post["parameters"] == [{"name": "name", "description": "description"}]
+    assert post["code"] == [{"language": "python", "content": "print(1)"}]
+
+
+def test_sqlite_delete_section_removes_posts_parameters_and_code(tmp_path):
+    db_path = sqlite_document(tmp_path)
+    with edit.SqliteHandler(db_path, "doc") as handler:
+        handler.createParameter("basics", "post1", "name", "description")
+        handler.createCode("basics", "post1", "python", "print(1)")
+        handler.createSection("Продвинутое", "advanced")
+        handler.deleteSection("basics")
+
+    conn = edit.connect_sqlite(db_path)
+    try:
+        for table, column in (("sections", "id"), ("posts", "section_id"), ("parameters", "section_id"),
+                              ("code", "section_id")):
+            rows = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE doc = 'doc' AND {column} = 'basics'")
+            assert rows.fetchone()[0] == 0, table
+        assert list(edit.read_sqlite_doc(conn, "doc")) == ["advanced"]
+    finally:
+        conn.close()
+
+
+def test_sqlite_export_round_trip(tmp_path):
+    db_path = sqlite_document(tmp_path)
+    with edit.SqliteHandler(db_path, "doc") as handler:
+        handler.createSection("Продвинутое", "advanced")
+        handler.createPost("advanced", "Заголовок", "post2", "Текст")
+        handler.createCode("advanced", "post2", "python", "print(2)")
+        expected = json.loads(json.dumps(handler.data))
+
+    out_path = str(tmp_path / "data.json")
+    edit.export_json(db_path, "doc", out_path)
+    with open(out_path, encoding="utf-8") as f:
+        site = json.load(f)
+    assert [section["id"] for section in site] == ["basics", "advanced"]  # Формат сайта - список секций
+
+    copy_path = str(tmp_path / "copy.sqlite")
+    edit.import_json(out_path, copy_path, "doc")
+    conn = edit.connect_sqlite(copy_path)
+    try:
+        assert edit.read_sqlite_doc(conn, "doc") == expected
+    finally:
+        conn.close()
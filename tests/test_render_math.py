@@ -0,0 +1,313 @@
+import inspect
+import sys
+from pathlib import Path
+
+import pytest
+
+import render_math
+
+
+SCENE_SOURCE = '''
+class Demo:
+    value = {value}
+
+    def construct(self):
+        return self.value
+'''
+
+
+@pytest.fixture
+def scene_file(tmp_path):
+    path = tmp_path / "demo_scenes.py"
+    path.write_text(SCENE_SOURCE.format(value=1), encoding="utf-8")
+    return path
+
+
+def test_load_scene_keeps_source_available(scene_file):
+    scene = render_math._load_scene(str(scene_file), "Demo")
+
+    assert scene.__module__ in sys.modules
+    assert "value = 1" in inspect.getsource(scene)
+    assert render_math._scene_ref(scene) == [str(scene_file), "Demo"]
+
+
+def test_load_scene_reload_picks_up_edit(scene_file):
+    first = render_math._load_scene(str(scene_file), "Demo")
+    scene_file.write_text(SCENE_SOURCE.format(value=2), encoding="utf-8")  # Тот же размер и та же секунда
+    second = render_math._load_scene(str(scene_file), "Demo")
+
+    assert second.value == 2
+    assert first.__module__ == second.__module__  # Перезагрузка заменяет модуль, а не копит новые
+
+
+def test_load_scene_error_keeps_previous_version(scene_file):
+    scene = render_math._load_scene(str(scene_file), "Demo")
+    scene_file.write_text("class Demo(:\n", encoding="utf-8")
+
+    with pytest.raises(SyntaxError):
+        render_math._load_scene(str(scene_file), "Demo")
+    assert sys.modules[scene.__module__].Demo is scene
+
+
+def test_render_key_of_loaded_scene(scene_file):
+    pytest.importorskip("manim")
+    scene = render_math._load_scene(str(scene_file), "Demo")
+
+    key = render_math.render_key(scene, "mp4", "l")
+    scene_file.write_text(SCENE_SOURCE.format(value=3), encoding="utf-8")
+    changed = render_math._load_scene(str(scene_file), "Demo")
+
+    assert len(key) == 64
+    assert render_math.render_key(changed, "mp4", "l") != key
+
+
+class CountFrames(render_math.FrameConsumer):
+    def start(self, width, height, fps):
+        self.size = (height, width)
+        self.frames = 0
+
+    def consume(self, frame):
+        assert frame.shape[:2] == self.size
+        self.frames += 1
+
+    def finish(self):
+        return self.frames
+
+
+def test_stream_scene_receives_frames_from_renderer(tmp_path, monkeypatch):
+    manim = pytest.importorskip("manim")
+    monkeypatch.chdir(tmp_path)
+
+    class Still(manim.Scene):
+        def construct(self):
+            self.add(manim.Square())
+            self.wait(1)  # Статичная сцена: CairoRenderer.add_frame пишет кадр с повтором
+
+    consumer = CountFrames()
+    [frames] = render_math.stream_scene(Still, [consumer], quality="l", media_dir=tmp_path / "media")
+
+    assert frames == 15  # low_quality: 15 кадров в секунду
+
+
+def run_daemon_job(monkeypatch, tmp_path, job) -> list:
+    """
+    Выполняет задачу демона в этом процессе и возвращает отправленные ею события.
+    """
+    import queue
+
+    events = queue.Queue()
+    monkeypatch.setattr(render_math, "_daemon_events", events)
+    monkeypatch.chdir(tmp_path)
+    render_math._daemon_job(1, job, str(tmp_path))
+    sent = []
+    while not events.empty():
+        job_id, event = events.get_nowait()
+        assert job_id == 1
+        sent.append(event)
+    return sent
+
+
+def test_daemon_job_loads_scene_from_file(scene_file, tmp_path, monkeypatch):
+    seen = {}
+
+    def create_anim(formula_name, scene, **kwargs):
+        seen["source"] = inspect.getsource(scene)
+        seen["ref"] = render_math._scene_ref(scene)
+
+    monkeypatch.setattr(render_math, "createAnim", create_anim)
+    events = run_daemon_job(monkeypatch, tmp_path, {"formula_name": "demo", "scene": [str(scene_file), "Demo"]})
+
+    assert [event["event"] for event in events] == ["started", "result"]
+    assert events[-1]["ok"], events[-1]["error"]
+    assert "value = 1" in seen["source"]
+    assert seen["ref"] == [str(scene_file), "Demo"]
+
+
+def test_daemon_job_renders_image(tmp_path, monkeypatch):
+    pytest.importorskip("manim")
+    scene_file = tmp_path / "daemon_scenes.py"
+    scene_file.write_text(
+        "from manim import Scene, Square\n\n\n"
+        "class Still(Scene):\n"
+        "    def construct(self):\n"
+        "        self.add(Square())\n",
+        encoding="utf-8",
+    )
+    job = {
+        "formula_name": "still", "outpath": str(tmp_path / "out"), "scene": [str(scene_file), "Still"],
+        "image_mode": True, "video_mode": False, "quality": "l", "use_cache": False,
+    }
+    events = run_daemon_job(monkeypatch, tmp_path, job)
+
+    assert events[-1]["event"] == "result"
+    assert events[-1]["ok"], events[-1]["error"]
+    assert (tmp_path / "out" / "still.png").is_file()
+
+
+def test_daemon_restarts_pool_after_worker_crash(tmp_path, monkeypatch):
+    import multiprocessing
+    import threading
+    import time
+
+    if multiprocessing.get_start_method() != "fork":
+        pytest.skip("подмены в воркерах видны только при fork")
+
+    def init_worker(threads, events):  # Без Manim: прогрев LaTeX здесь не нужен
+        render_math._daemon_events = events
+
+    monkeypatch.setattr(render_math, "_init_daemon_worker", init_worker)
+    monkeypatch.setattr(render_math, "createAnim", lambda **job: None)
+    (tmp_path / "crash.py").write_text("import os\nos._exit(3)\n", encoding="utf-8")
+    (tmp_path / "fine.py").write_text("class Fine:\n    pass\n", encoding="utf-8")
+    socket_path = tmp_path / "render.sock"
+    server = threading.Thread(target=render_math.serve, kwargs={"workers": 1, "socket_path": socket_path})
+    server.start()
+    try:
+        while not socket_path.exists():
+            time.sleep(0.05)
+        events = [
+            render_math.daemon_request(
+                {"cmd": "render", "job": {"formula_name": name, "scene": [str(tmp_path / f"{name}.py"), scene]},
+                 "cwd": str(tmp_path)},
+                socket_path=socket_path,
+            )
+            for name, scene in [("crash", "Crash"), ("fine", "Fine")]
+        ]
+    finally:
+        render_math.daemon_request({"cmd": "stop"}, socket_path=socket_path)
+        server.join(timeout=10)
+
+    assert events[0]["event"] == "unavailable"  # createAnim в этом случае рендерит сам
+    assert events[1]["event"] == "result" and events[1]["ok"]
+
+
+def test_output_cache_evict_drops_least_recent(tmp_path, monkeypatch):
+    monkeypatch.setattr(render_math, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(render_math, "FORMULA_CACHE_DIR", tmp_path / "formulas")
+    (tmp_path / "formulas").mkdir()
+    old, new = tmp_path / f"{'a' * 64}.mp4", tmp_path / f"{'b' * 64}.mp4"
+    for atime, path in enumerate([old, new, tmp_path / "reports.jsonl"]):
+        path.write_bytes(b"x" * 100)
+        render_math.os.utime(path, (atime, atime))
+    for suffix in (".png", ".svg"):
+        (tmp_path / "formulas" / f"{'c' * 64}{suffix}").write_bytes(b"x" * 100)
+
+    freed = render_math.output_cache_evict(max_bytes=150, formula_bytes=200)
+
+    assert freed == 100
+    assert not old.exists() and new.exists()
+    assert (tmp_path / "reports.jsonl").exists()  # Служебные файлы кэша не трогаем
+    assert len(list((tmp_path / "formulas").iterdir())) == 2
+
+
+def test_find_black_borders_keeps_thin_content_in_later_frames(monkeypatch):
+    np = pytest.importorskip("numpy")
+    frames = np.zeros((40, 48, 64), np.uint8)
+    frames[:, 20:30, 20:40] = 200     # Основное содержимое во всех кадрах
+    frames[35, 2, 5:60] = 255         # Линия толщиной в пиксель в одном позднем кадре
+    frames[39, 20:25, 62] = 30        # Тусклая точка у правого края
+
+    monkeypatch.setattr(render_math, "probe_video", lambda path: {"width": 64, "height": 48, "frames": 40})
+    monkeypatch.setattr(render_math, "_gray_frames",
+                        lambda path, video_filter, width, height: (frames[i:i + 16] for i in range(0, 40, 16)))
+
+    assert render_math.find_black_borders("video.mp4") == [5, 2, 1, 18]
+
+
+def test_tex_lock_and_torn_svg(tmp_path, monkeypatch):
+    monkeypatch.setattr(render_math, "TEX_CACHE_DIR", tmp_path)
+    svg = tmp_path / "formula.svg"
+    svg.write_text("<svg>" + " " * 200 + "</svg>\n", encoding="utf-8")
+    torn = tmp_path / "torn.svg"
+    torn.write_text("<svg>" + " " * 200, encoding="utf-8")
+
+    with render_math._tex_lock(r"\frac{a}{b}"):
+        assert render_math._svg_complete(svg)
+        assert not render_math._svg_complete(torn)
+    assert len(list((tmp_path / ".locks").iterdir())) == 1
+
+
+def fake_latex(cmd, cwd, **kwargs):
+    """
+    Подменяет latex/dvipng/dvisvgm: страница - это текст формулы,
+    номера SVG дополняются нулями, как у dvisvgm.
+    """
+    import re
+    import subprocess
+
+    formulas = re.findall(r"\\displaystyle (.*?)\$", (Path(cwd) / "batch.tex").read_text(encoding="utf-8"))
+    if cmd[0] == "latex" and any("\\bad" in tex for tex in formulas):
+        return subprocess.CompletedProcess(cmd, 1, "! Undefined control sequence.", "")
+    width = len(str(len(formulas)))
+    for page, tex in enumerate(formulas, start=1):
+        if cmd[0] == "dvipng":
+            (Path(cwd) / f"page-{page}.png").write_text(tex, encoding="utf-8")
+        elif cmd[0] == "dvisvgm":
+            (Path(cwd) / f"page-{page:0{width}d}.svg").write_text(tex, encoding="utf-8")
+    return subprocess.CompletedProcess(cmd, 0, "", "")
+
+
+def test_render_formulas_pages_and_bad_formula(tmp_path, monkeypatch):
+    import subprocess
+
+    monkeypatch.setattr(render_math, "FORMULA_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(subprocess, "run", fake_latex)
+    formulas = {f"f{i}": f"x^{{{i}}}" for i in range(12)}
+
+    results = render_math.render_formulas(formulas, outpath=tmp_path / "out")
+    for name, tex in formulas.items():
+        assert results[name].read_text(encoding="utf-8") == tex
+        assert (tmp_path / "out" / f"{name}.svg").read_text(encoding="utf-8") == tex
+
+    with pytest.raises(RuntimeError, match="broken"):
+        render_math.render_formulas({"good": "y^2", "broken": r"\bad"}, outpath=tmp_path / "out")
+    assert (tmp_path / "cache" / f"{render_math.formula_key('y^2')}.png").is_file()
+
+
+@pytest.mark.parametrize("durations, chunks, expected", [
+    ([1.0, 1.0], 5, [(0, 0), (1, 1)]),                    # Частей больше, чем анимаций
+    ([2.0, 1.0, 1.0, 2.0], 2, [(0, 1), (2, 3)]),
+    ([0.0, 0.0, 0.0, 0.0], 2, [(0, 0), (1, 3)]),          # Нулевые длительности (add, wait(0))
+    ([0.0, 0.0, 0.0], 3, [(0, 0), (1, 1), (2, 2)]),
+    ([3.0], 4, [(0, 0)]),
+])
+def test_split_animations(durations, chunks, expected):
+    ranges = render_math.split_animations(durations, chunks)
+
+    assert ranges == expected
+    assert [index for first, last in ranges for index in range(first, last + 1)] == list(range(len(durations)))
+
+
+@pytest.mark.parametrize("workers, threads, tasks, expected", [
+    (0, 2, 0, (4, 2)),       # По числу ядер / threads
+    (0, 3, 0, (2, 4)),       # Остаток ядер делится между процессами
+    (0, 16, 0, (1, 8)),      # Потоков больше, чем ядер: один процесс на все ядра
+    (0, 2, 3, (3, 2)),       # Процессов не больше, чем задач
+    (16, 2, 0, (16, 1)),     # Явно заданных процессов больше, чем ядер: по потоку на процесс
+])
+def test_pool_size(monkeypatch, workers, threads, tasks, expected):
+    monkeypatch.setattr(render_math.os, "cpu_count", lambda: 8)
+
+    assert render_math.pool_size(workers, threads, tasks) == expected
+
+
+def test_pool_size_unknown_cpu_count(monkeypatch):
+    monkeypatch.setattr(render_math.os, "cpu_count", lambda: None)
+
+    assert render_math.pool_size(0, 2) == (1, 1)
+
+
+@pytest.mark.parametrize("width, height, offsets, expected", [
+    (1920, 1080, (0, 0, 0, 0), "crop=1920:1080:0:0"),
+    (101, 57, (0, 0, 0, 0), "crop=100:56:0:0"),         # Нечётный кадр: размеры чётные для yuv420p
+    (100, 50, (1, 1, 0, 0), "crop=98:48:1:1"),          # Нечётные отступы
+    (100, 50, (3, 0, 4, 0), "crop=92:50:3:0"),
+])
+def test_crop_filter_even_sizes(width, height, offsets, expected):
+    assert render_math._crop_filter(width, height, offsets) == expected
+
+
+@pytest.mark.parametrize("offsets", [(-1, 0, 0, 0), (50, 0, 50, 0), (0, 25, 0, 24)])
+def test_crop_filter_rejects_bad_offsets(offsets):
+    with pytest.raises(ValueError):
+        render_math._crop_filter(100, 50, offsets)
@@ -1,17 +1,552 @@
 import json
 import os
+import sys
+import sqlite3
+import re
+import math
+import bisect
+import inspect
 from datetime import datetime
-import shutil
+import atexit
+import time
+import hashlib
+import threading
+import functools
+import copy
+from contextlib import contextmanager
 from typing import Callable, Optional, Tuple, Any
 
 
+def journaled(method):
+    """
+    Изменение документа: выполняется под блокировкой и после успеха
+    записывается в журнал (см. JsonHandler._log и JsonHandler._mutation).
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._mutation():
+            result = method(self, *args, **kwargs)
+            self._log(method.__name__, args, kwargs)
+        return result
+    return wrapper
+
+
+class BackupStore:
+    """
+    Бэкапы документов с дедупликацией.
+
+    Снимок документа - манифест: секции по порядку и хэши списков их
+    постов. Посты, списки и манифесты лежат в objects/ под хэшем своего
+    содержимого, поэтому неизменённые посты и секции не копируются, и
+    новый снимок занимает столько места, сколько изменилось. Снимки перечислены в
+    index.jsonl и прореживаются политикой хранения (prune) не при каждом
+    сохранении, а раз в PRUNE_EVERY новых снимков, если есть что удалять.
+    """
+    KEEP_LAST = 20                # Последние снимки каждого файла
+    KEEP_HOURLY = 48              # По одному снимку на час
+    KEEP_DAILY = 30               # По одному снимку на день
+    MAX_BYTES = 50 * 1024 ** 2    # Предельный размер objects/
+    PRUNE_EVERY = 20              # Новых снимков между запусками prune
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.jsonl")
+        self._known: set[str] = set()  # Хэши объектов, которые точно есть на диске
+        self._entries: Optional[list[dict]] = None  # Записи index.jsonl
+        self._index_size = 0      # Размер index.jsonl, которому соответствуют _entries
+        self._bytes: Optional[int] = None  # Размер objects/ (считается один раз, дальше - приращениями)
+        self._added = 0           # Снимков с последнего prune
+
+    def _objectPath(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _put(self, value: Any) -> str:
+        text = json.dumps(value, ensure_ascii=False, sort_keys=True)
+        digest = _text_hash(text)
+        if digest not in self._known:
+            path = self._objectPath(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + ".tmp", "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(path + ".tmp", path)
+                if self._bytes is not None:
+                    self._bytes += os.path.getsize(path)
+            self._known.add(digest)
+        return digest
+
+    def _get(self, digest: str) -> Any:
+        with open(self._objectPath(digest), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _readIndex(self) -> list[dict]:
+        """
+        Записи индекса. Файл перечитывается, только если его изменил кто-то
+        другой (например, редактор другого документа в той же папке).
+        """
+        size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        if self._entries is None or size != self._index_size:
+            self._entries = []
+            if size:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    self._entries = [json.loads(line) for line in f if line.strip()]
+            self._index_size = size
+        return self._entries
+
+    def _objectsBytes(self) -> int:
+        if self._bytes is None:
+            self._bytes = sum(os.path.getsize(os.path.join(folder, name))
+                              for folder, _, names in os.walk(self.objects_dir) for name in names)
+        return self._bytes
+
+    def snapshots(self, name: str) -> list[dict]:
+        """
+        Снимки файла name от новых к старым: {'file', 'time', 'manifest', 'posts'}.
+        """
+        return sorted((entry for entry in self._readIndex() if entry["file"] == name),
+                      key=lambda entry: entry["time"], reverse=True)
+
+    def save(self, name: str, data: dict) -> Optional[dict]:
+        """
+        Сохраняет снимок документа name, если он отличается от последнего.
+
+        Returns:
+            dict: запись индекса нового снимка или None, если изменений нет
+        """
+        manifest = []
+        posts = 0
+        for section_id, section in data.items():
+            content = section.get("content")
+            if isinstance(content, dict):
+                fields = {key: value for key, value in section.items() if key != "content"}
+                posts_list = [[post_id, self._put(post)] for post_id, post in content.items()]
+                manifest.append([section_id, fields, self._put(posts_list)])
+                posts += len(content)
+            else:
+                manifest.append([section_id, section, None])
+        digest = self._put(manifest)
+
+        latest = self.snapshots(name)
+        if latest and latest[0]["manifest"] == digest:
+            return None
+        entry = {"file": name, "time": time.time(), "manifest": digest, "posts": posts}
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._entries.append(entry)
+        self._index_size = os.path.getsize(self.index_path)
+
+        # Пока снимков меньше KEEP_LAST и объекты укладываются в MAX_BYTES, удалять нечего
+        self._added += 1
+        if self._added >= self.PRUNE_EVERY and (
+                len(latest) >= self.KEEP_LAST or self._objectsBytes() > self.MAX_BYTES):
+            self.prune()
+        return entry
+
+    def load(self, manifest: str) -> dict:
+        """
+        Собирает документ из снимка с хэшем манифеста manifest.
+        """
+        data = {}
+        for section_id, fields, posts in self._get(manifest):
+            if posts is None:
+                data[section_id] = fields
+            else:
+                content = {post_id: self._get(digest) for post_id, digest in self._get(posts)}
+                data[section_id] = {**fields, "content": content}
+        return data
+
+    def find(self, name: str, when: Optional[float] = None) -> Optional[dict]:
+        """
+        Последний снимок файла name, сделанный не позже when (по умолчанию - самый новый).
+        """
+        for entry in self.snapshots(name):
+            if when is None or entry["time"] <= when:
+                return entry
+        return None
+
+    def _references(self, manifest: str) -> list[str]:
+        refs = [manifest]
+        for _, _, posts in self._get(manifest):
+            if posts is not None:
+                refs.append(posts)
+                refs += [digest for _, digest in self._get(posts)]
+        return refs
+
+    def prune(self):
+        """
+        Применяет политику хранения: для каждого файла остаются KEEP_LAST
+        последних снимков и самые новые снимки KEEP_HOURLY последних часов
+        и KEEP_DAILY последних дней. Если объекты всё равно занимают больше
+        MAX_BYTES, удаляются самые старые снимки (кроме последнего снимка
+        каждого файла). Объекты, на которые не ссылается ни один снимок,
+        удаляются.
+        """
+        entries = self._readIndex()
+        self._added = 0
+        kept = []
+        for name in {entry["file"] for entry in entries}:
+            hours, days = set(), set()
+            for number, entry in enumerate(sorted((e for e in entries if e["file"] == name),
+                                                  key=lambda e: e["time"], reverse=True)):
+                hour = int(entry["time"] // 3600)
+                day = datetime.fromtimestamp(entry["time"]).date()
+                keep = number < self.KEEP_LAST
+                if hour not in hours and len(hours) < self.KEEP_HOURLY:
+                    hours.add(hour)
+                    keep = True
+                if day not in days and len(days) < self.KEEP_DAILY:
+                    days.add(day)
+                    keep = True
+                if keep:
+                    kept.append(entry)
+
+        # Счётчики ссылок и размеры объектов
+        refs: dict[str, int] = {}
+        for entry in kept:
+            for digest in self._references(entry["manifest"]):
+                refs[digest] = refs.get(digest, 0) + 1
+        sizes = {digest: os.path.getsize(self._objectPath(digest)) for digest in refs}
+        total = sum(sizes.values())
+
+        newest = {}
+        for entry in kept:
+            if entry["time"] > newest.get(entry["file"], -1.0):
+                newest[entry["file"]] = entry["time"]
+        for entry in sorted(kept, key=lambda e: e["time"]):
+            if total <= self.MAX_BYTES:
+                break
+            if newest[entry["file"]] == entry["time"]:
+                continue
+            kept.remove(entry)
+            for digest in self._references(entry["manifest"]):
+                refs[digest] -= 1
+                if not refs[digest]:
+                    total -= sizes[digest]
+                    del refs[digest]
+
+        if len(kept) == len(entries):
+            return
+        kept.sort(key=lambda e: e["time"])
+        with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in kept)
+        os.replace(self.index_path + ".tmp", self.index_path)
+        self._entries, self._index_size = kept, os.path.getsize(self.index_path)
+        self._bytes = total
+
+        for folder in os.listdir(self.objects_dir):
+            for digest in os.listdir(os.path.join(self.objects_dir, folder)):
+                if digest not in refs:
+                    os.remove(os.path.join(self.objects_dir, folder, digest))
+        self._known &= set(refs)
+
+
+WORD = re.compile(r"[^\W_]+")
+# Окончания от длинных к коротким: отрезается первое подходящее, если остаётся хотя бы 3 буквы
+RU_ENDINGS = (
+    "иями", "ями", "ия", "ию", "ии", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ией", "иях",
+    "ах", "ях", "ам", "ям", "ом", "ем", "ой", "ей", "ий", "ый", "ая", "яя", "ое", "ее",
+    "ые", "ие", "ую", "юю", "ов", "ев", "ть", "а", "я", "о", "е", "ы", "и", "у", "ю", "ь",
+)
+EN_ENDINGS = ("ing", "ed", "es", "s")
+
+
+def stem(word: str) -> str:
+    """
+    Грубый стемминг русских и английских слов: отрезает окончание,
+    чтобы "переменная" и "переменные" попадали в один терм.
+    """
+    endings = RU_ENDINGS if re.search("[а-я]", word) else EN_ENDINGS
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Термы текста: слова и числа в нижнем регистре (ё = е), без окончаний, длиной от 2 символов.
+    """
+    return [stem(word) for word in WORD.findall(text.lower().replace("ё", "е")) if len(word) > 1]
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Расстояние Левенштейна; как только оно заведомо больше limit, возвращает limit + 1.
+    """
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class SearchIndex:
+    """
+    Полнотекстовый индекс по постам всех docs/*.json.
+
+    Хранится одним компактным файлом docs/search/index.json, который
+    может загрузить и сайт (static/search.js):
+
+        {"docs": [[файл, секция, пост, заголовок], ...],
+         "terms": {терм: [номер поста, вес, номер поста, вес, ...]},
+         "files": {файл: [mtime_ns, размер]}}
+
+    Индексируются файлы и в формате редактора, и в формате сайта
+    (список секций, как docs/data.json). Изменённые вне редактора файлы
+    переиндексируются целиком (sync), правки через JsonHandler(search=...) -
+    по одному посту.
+    """
+    FIELD_WEIGHTS = {"title": 3, "name": 2, "explanation": 1, "description": 1, "code": 1}
+    MAX_WEIGHT = 100  # Чтобы длинный код не перевешивал заголовки
+
+    def __init__(self, docs_dir: str = "docs"):
+        self.docs_dir = docs_dir
+        self.path = os.path.join(docs_dir, "search", "index.json")
+        self.docs: list[Optional[list]] = []         # None - удалённый пост (номера сжимаются в save)
+        self.terms: dict[str, list[int]] = {}
+        self.files: dict[str, list[int]] = {}
+        self.dirty = False
+        self._keys: dict[tuple, int] = {}            # (файл, секция, пост) -> номер
+        self._forward: Optional[dict[int, list[str]]] = None  # номер -> термы, строится при первом изменении
+        self._vocabulary: Optional[list[str]] = None  # Отсортированные термы для поиска по префиксу
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.docs, self.terms, self.files = index["docs"], index["terms"], index["files"]
+        self._keys = {tuple(doc[:3]): number for number, doc in enumerate(self.docs)}
+
+    def save(self):
+        """
+        Сжимает номера постов и атомарно записывает индекс.
+        """
+        numbers = {}
+        docs = []
+        for number, doc in enumerate(self.docs):
+            if doc is not None:
+                numbers[number] = len(docs)
+                docs.append(doc)
+        terms = {}
+        for term, postings in sorted(self.terms.items()):
+            terms[term] = [value for i in range(0, len(postings), 2)
+                           for value in (numbers[postings[i]], postings[i + 1])]
+        self.docs, self.terms = docs, terms
+        self._keys = {tuple(doc[:3]): number for number, doc in enumerate(docs)}
+        self._forward = None
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"docs": docs, "terms": terms, "files": self.files}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    # Изменение индекса
+    def _postTerms(self, post: dict) -> dict[str, int]:
+        weights: dict[str, int] = {}
+        fields = [("title", post.get("title", "")), ("explanation", post.get("explanation", ""))]
+        for param in post.get("parameters", []):
+            fields += [("name", param.get("name", "")), ("description", param.get("description", ""))]
+        fields += [("code", block.get("content", "")) for block in post.get("code", [])]
+        for field, text in fields:
+            for term in tokenize(text):
+                weights[term] = min(weights.get(term, 0) + self.FIELD_WEIGHTS[field], self.MAX_WEIGHT)
+        return weights
+
+    def _add(self, key: tuple, post: dict):
+        number = len(self.docs)
+        self.docs.append([*key, post.get("title", "")])
+        self._keys[key] = number
+        weights = self._postTerms(post)
+        for term, weight in weights.items():
+            if term not in self.terms:
+                self._vocabulary = None
+            self.terms.setdefault(term, []).extend((number, weight))
+        if self._forward is not None:
+            self._forward[number] = list(weights)
+
+    def _remove(self, key: tuple):
+        number = self._keys.pop(key, None)
+        if number is None:
+            return
+        if self._forward is None:
+            self._forward = {}
+            for term, postings in self.terms.items():
+                for i in range(0, len(postings), 2):
+                    self._forward.setdefault(postings[i], []).append(term)
+        for term in self._forward.pop(number, []):
+            postings = self.terms[term]
+            at = next(i for i in range(0, len(postings), 2) if postings[i] == number)
+            del postings[at:at + 2]
+            if not postings:
+                del self.terms[term]
+                self._vocabulary = None
+        self.docs[number] = None
+
+    def update(self, name: str, data: dict, sections=(), posts=()):
+        """
+        Приводит индекс файла name в соответствие с data для изменённых
+        секций (все их посты) и постов ((секция, пост)).
+        """
+        for section_id in sections:
+            for key in [key for key in self._keys if key[0] == name and key[1] == section_id]:
+                self._remove(key)
+            for post_id, post in data.get(section_id, {}).get("content", {}).items():
+                self._add((name, section_id, post_id), post)
+        for section_id, post_id in posts:
+            if section_id in sections:
+                continue
+            self._remove((name, section_id, post_id))
+            post = data.get(section_id, {}).get("content", {}).get(post_id)
+            if post is not None:
+                self._add((name, section_id, post_id), post)
+        self.dirty = True
+
+    def indexFile(self, name: str, data: Optional[dict]):
+        """
+        Переиндексирует файл целиком (data=None - удаляет его из индекса).
+        """
+        for key in [key for key in self._keys if key[0] == name]:
+            self._remove(key)
+        if data is not None:
+            self.update(name, data, sections=list(data))
+        self.dirty = True
+
+    def stamp(self, path: str):
+        """
+        Запоминает, что индекс соответствует файлу path в его текущем виде.
+        """
+        stat = os.stat(path)
+        self.files[os.path.basename(path)] = [stat.st_mtime_ns, stat.st_size]
+        self.dirty = True
+
+    def sync(self) -> int:
+        """
+        Переиндексирует файлы docs/*.json, изменённые с прошлого раза, и
+        убирает удалённые. Сохраняет индекс, если он изменился.
+
+        Returns:
+            int: сколько файлов переиндексировано
+        """
+        names = {name for name in os.listdir(self.docs_dir) if name.endswith(".json")}
+        changed = 0
+        for name in sorted(names):
+            path = os.path.join(self.docs_dir, name)
+            stat = os.stat(path)
+            if self.files.get(name) == [stat.st_mtime_ns, stat.st_size]:
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.indexFile(name, from_site_json(data) if isinstance(data, list) else data)
+            self.stamp(path)
+            changed += 1
+        for name in set(self.files) - names:
+            self.indexFile(name, None)
+            del self.files[name]
+            changed += 1
+        if self.dirty:
+            self.save()
+        return changed
+
+    # Поиск
+    def _expand(self, term: str) -> list[tuple[str, float]]:
+        """
+        Термы словаря для терма запроса с множителем: точное совпадение 1,
+        продолжение (префикс) 0.6, опечатка 0.4 - только если нет первых двух.
+        """
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.terms)
+        matches = [(term, 1.0)] if term in self.terms else []
+        start = bisect.bisect_right(self._vocabulary, term)
+        for candidate in self._vocabulary[start:start + 50]:
+            if not candidate.startswith(term):
+                break
+            matches.append((candidate, 0.6))
+        if matches:
+            return matches
+
+        limit = 1 if len(term) <= 5 else 2
+        start = bisect.bisect_left(self._vocabulary, term[0])
+        end = bisect.bisect_left(self._vocabulary, chr(ord(term[0]) + 1))
+        return [(candidate, 0.4) for candidate in self._vocabulary[start:end]
+                if abs(len(candidate) - len(term)) <= limit and _edit_distance(term, candidate, limit) <= limit]
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        """
+        Ищет посты, в которых есть все слова запроса (с учётом префиксов и опечаток).
+
+        Returns:
+            list[dict]: {'file', 'section', 'post', 'title', 'score'} по убыванию score
+        """
+        total = sum(doc is not None for doc in self.docs) or 1
+        scores: Optional[dict[int, float]] = None
+        for term in dict.fromkeys(tokenize(query)):
+            matches: dict[int, float] = {}
+            for candidate, factor in self._expand(term):
+                postings = self.terms[candidate]
+                idf = math.log(1 + total / (len(postings) // 2))
+                for i in range(0, len(postings), 2):
+                    score = postings[i + 1] * factor * idf
+                    if score > matches.get(postings[i], 0.0):
+                        matches[postings[i]] = score
+            scores = matches if scores is None else {
+                number: score + matches[number] for number, score in scores.items() if number in matches
+            }
+            if not scores:
+                return []
+
+        best = sorted((scores or {}).items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{"file": self.docs[number][0], "section": self.docs[number][1], "post": self.docs[number][2],
+                 "title": self.docs[number][3], "score": round(score, 3)} for number, score in best]
+
+
 class JsonHandler:
-    def __init__(self, path: str):
+    COMPACT_EVERY = 500  # Записей в журнале до фоновой перезаписи всего файла
+
+    def __init__(self, path: str, journal: bool = True, search: Optional[SearchIndex] = None,
+                 name: Optional[str] = None):
+        """
+        Args:
+            path: путь к JSON файлу документации
+            journal: дописывать изменения в журнал (path + ".journal") вместо
+                перезаписи всего файла; файл пересобирается в фоне и при выходе
+            search: поисковый индекс, который обновляется при каждом изменении
+            name: имя документа в бэкапах и индексе, по умолчанию имя файла
+        """
         self.path = path
+        self.journal = journal
+        self.search = search
+        self.journal_path = path + ".journal"
+        self.pending_path = path + ".journal.1"  # Журнал, который сейчас переносится в файл
+        self.name = name or os.path.basename(path)
+        self.backups = BackupStore(os.path.join(os.path.dirname(path), "backups"))
         
         self.data: dict[str, Any] = dict()
+        # Порядок блокировок везде один: сначала _compact_lock (перезапись файла,
+        # см. pushJson), потом _lock (данные в памяти и журнал)
+        self._lock = threading.RLock()
+        self._compact_lock = threading.RLock()
+        self._journal_file = None
+        self._journal_records = 0
+        self._replaying = False
+        self._batch: Optional[list] = None  # Записи открытой транзакции (см. transaction)
+        self._compactor: Optional[threading.Thread] = None
 
         self.loadJson()
+        self._backup()  # Версия на диске до правок
+        if journal:
+            self._recover()
+        if journal or search is not None:
+            atexit.register(self.close)
 
     def __str__(self):
         return json.dumps(self.data, ensure_ascii=False, indent=4)
@@ -19,31 +554,308 @@ class JsonHandler:
     def __getitem__(self, key: str):
         return self.data[key]
  
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
     def loadJson(self):
         with open(self.path, "r", encoding="utf-8") as f:
             self.data = json.load(f)
 
+    @contextmanager
+    def _locked(self):
+        """
+        Блокировки для изменения документа. Без журнала изменение сразу
+        перезаписывает файл (pushJson), поэтому _compact_lock берётся заранее.
+        """
+        if self.journal:
+            with self._lock:
+                yield
+        else:
+            with self._compact_lock, self._lock:
+                yield
+
+    def _mutation(self):
+        """
+        Обёртка одного изменения вне транзакции. Файл и журнал пишутся только
+        после успешного изменения в памяти, поэтому хватает блокировок.
+        """
+        return self._locked()
+
     def pushJson(self):
-        # Создаем папку для бэкапов, если её нет
-        backup_dir = os.path.join(os.path.dirname(self.path), "backups")
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        # Создаем имя файла бэкапа с датой/временем
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        backup_filename = f"{timestamp}.json"
-        backup_path = os.path.join(backup_dir, backup_filename)
-        
-        # Создаем бэкап текущего файла, если он существует
-        if os.path.exists(self.path):
-            shutil.copy2(self.path, backup_path)
-            print(f"Создан бэкап: {backup_path}")
-
-        # Сохраняем изменения в файл
-        with open(self.path, "w", encoding="utf-8") as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=4)
-        self.loadJson()
+        """
+        Атомарно перезаписывает весь файл текущим состоянием. В режиме
+        журнала текущий журнал откладывается в pending_path и удаляется,
+        только когда новый файл уже на месте.
+        """
+        with self._compact_lock:
+            with self._lock:
+                text = json.dumps(self.data, ensure_ascii=False, indent=4)
+                if self._journal_file is not None:
+                    self._journal_file.close()
+                    os.replace(self.journal_path, self.pending_path)
+                    self._openJournal(text)
+                self._backup()
+
+            # Сохраняем изменения во временный файл и подменяем им исходный
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            _fsync_dir(self.path)
+            if self.search is not None:
+                self.search.stamp(self.path)
+
+            if os.path.exists(self.pending_path):
+                os.remove(self.pending_path)
+
+    def _backup(self):
+        entry = self.backups.save(self.name, self.data)
+        if entry:
+            print(f"Создан бэкап: {datetime.fromtimestamp(entry['time']):%Y-%m-%d %H:%M:%S}")
+
+    def restore(self, when: float):
+        """
+        Восстанавливает документ из последнего бэкапа, сделанного не позже
+        when (timestamp). Текущее состояние тоже сохраняется в бэкап, так
+        что восстановление можно отменить.
+        """
+        with self._compact_lock, self._lock:
+            entry = self.backups.find(self.name, when)
+            if entry is None:
+                raise ValueError("Нет бэкапа на это время.")
+            self._backup()
+            data = self.backups.load(entry["manifest"])
+            self.data.clear()
+            self.data.update(data)
+            if self.search is not None:
+                self.search.indexFile(self.name, self.data)
+            self.pushJson()
+
+    # Журнал
+    def _openJournal(self, base_text: str):
+        """
+        Начинает новый журнал. Первая строка - хэш файла, к которому применяются записи.
+        """
+        self._journal_file = open(self.journal_path, "w", encoding="utf-8")
+        self._journal_file.write(json.dumps({"base": _text_hash(base_text)}) + "\n")
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+        self._journal_records = 0
+
+    def _replay(self, journal_path: str, base_hash: Optional[str] = None) -> int:
+        """
+        Повторяет записи журнала над self.data.
+
+        Args:
+            journal_path: путь к журналу
+            base_hash: применять журнал, только если он начат от файла с этим хэшем
+
+        Returns:
+            int: сколько записей применено
+        """
+        with open(journal_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        if not lines:
+            return 0
+        try:
+            header = json.loads(lines[0])
+        except json.JSONDecodeError:
+            return 0
+        if base_hash is not None and header.get("base") != base_hash:
+            return 0  # Записи уже есть в файле
+
+        count = 0
+        self._replaying = True
+        try:
+            for line in lines[1:]:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Недописанная запись при сбое
+                self._apply(record)
+                count += 1
+        finally:
+            self._replaying = False
+        return count
+
+    def _recover(self):
+        """
+        Применяет журналы, оставшиеся после прошлого запуска, и начинает новый журнал.
+        """
+        with open(self.path, "r", encoding="utf-8") as f:
+            base_text = f.read()
+
+        recovered = 0
+        if os.path.exists(self.pending_path):
+            recovered += self._replay(self.pending_path, _text_hash(base_text))
+        if os.path.exists(self.journal_path):
+            recovered += self._replay(self.journal_path)
+
+        if recovered:
+            print(f"Восстановлено изменений из журнала: {recovered}")
+            if self.search is not None:
+                self.search.indexFile(self.name, self.data)
+            self.pushJson()
+        for path in (self.pending_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._openJournal(json.dumps(self.data, ensure_ascii=False, indent=4) if recovered else base_text)
+
+    def _apply(self, record: dict):
+        if record["op"] == "transaction":
+            for inner in record["records"]:
+                self._apply(inner)
+        else:
+            getattr(self, record["op"])(*record["args"], **record["kwargs"])
+
+    def _write(self, record: dict):
+        """
+        Дописывает запись в журнал одной строкой и сбрасывает её на диск.
+        Недописанная при сбое строка отбрасывается при восстановлении целиком.
+        """
+        self._journal_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+        self._journal_records += 1
+
+        if self._journal_records >= self.COMPACT_EVERY and not (self._compactor and self._compactor.is_alive()):
+            self._compactor = threading.Thread(target=self.pushJson)
+            self._compactor.start()
+
+    def _log(self, op: str, args: tuple, kwargs: dict):
+        """
+        Дописывает изменение в журнал и сбрасывает его на диск. Без журнала
+        сразу перезаписывает весь файл.
+        """
+        if self._replaying:
+            return
+        if self._batch is not None:
+            self._batch.append({"op": op, "args": args, "kwargs": kwargs})
+        else:
+            self._commit([{"op": op, "args": args, "kwargs": kwargs}])
+            self._index([{"op": op, "args": args, "kwargs": kwargs}])
+
+    def _index(self, records: list[dict]):
+        """
+        Обновляет поисковый индекс для секций и постов, которых коснулись сохранённые изменения.
+        """
+        if self.search is None:
+            return
+        sections, posts = set(), set()
+        for record in records:
+            arguments = inspect.signature(getattr(JsonHandler, record["op"])).bind(
+                self, *record["args"], **record["kwargs"]).arguments
+            if record["op"] == "editSection":
+                sections.update((arguments["section_id_to_edit"], arguments["new_section_id"]))
+            elif record["op"] == "deleteSection":
+                sections.add(arguments["section_id_to_delete"])
+            elif record["op"] == "editPost":
+                posts.update(((arguments["section_id"], arguments["post_id"]),
+                              (arguments["section_id"], arguments["new_id"])))
+            elif "post_id" in arguments:
+                posts.add((arguments["section_id"], arguments["post_id"]))
+        self.search.update(self.name, self.data, sections, posts)
+
+    def _commit(self, records: list[dict]):
+        """
+        Сохраняет уже применённые в памяти изменения: одной строкой журнала
+        или, без журнала, перезаписью всего файла.
+        """
+        if not self.journal:
+            self.pushJson()
+        elif len(records) == 1:
+            self._write(records[0])
+        else:
+            self._write({"op": "transaction", "records": records})
+
+    @contextmanager
+    def transaction(self):
+        """
+        Пакет изменений, который сохраняется целиком или не сохраняется вовсе:
+
+            with handler.transaction():
+                handler.createPost("basics", "Заголовок", "post2", "Объяснение")
+                handler.createParameter("basics", "post2", "name", "description")
+
+        Изменения применяются в памяти, после блока документ проверяется
+        (validate) и записывается одной записью журнала или, без журнала,
+        одной перезаписью файла с одним бэкапом. При исключении состояние
+        в памяти откатывается, а файл и журнал не меняются. Вложенные
+        транзакции входят во внешнюю.
+        """
+        with self._locked():
+            if self._batch is not None:
+                yield self
+                return
+
+            snapshot = copy.deepcopy(self.data)
+            self._batch = []
+            try:
+                yield self
+                self.validate()
+                records, self._batch = self._batch, None
+                if records:
+                    self._commit(records)
+                    self._index(records)
+            except BaseException:
+                self.data.clear()
+                self.data.update(snapshot)
+                raise
+            finally:
+                self._batch = None
+
+    def validate(self):
+        """
+        Проверяет структуру документа: ключи совпадают с id, у секций и
+        постов есть обязательные поля, параметры и код - списки словарей.
+
+        Raises:
+            ValueError: с описанием первой найденной ошибки
+        """
+        for section_id, section in self.data.items():
+            if not isinstance(section, dict) or section.get("id") != section_id or "name" not in section:
+                raise ValueError(f"Секция {section_id} повреждена: нужны name и id, совпадающий с ключом.")
+            if not isinstance(section.get("content"), dict):
+                raise ValueError(f"У секции {section_id} нет словаря content.")
+
+            for post_id, post in section["content"].items():
+                where = f"пост {post_id} в секции {section_id}"
+                if not isinstance(post, dict) or post.get("id") != post_id:
+                    raise ValueError(f"Неверный {where}: id должен совпадать с ключом.")
+                if not (post.get("title") and post.get("explanation")):
+                    raise ValueError(f"Заполните заголовок и содержание: {where}.")
+                for field, keys in (("parameters", ("name", "description")), ("code", ("language", "content"))):
+                    items = post.get(field, [])
+                    if not isinstance(items, list) or not all(
+                            isinstance(item, dict) and all(isinstance(item.get(key), str) for key in keys)
+                            for item in items):
+                        raise ValueError(f"Поле {field} повреждено: {where}.")
+
+    def close(self):
+        """
+        Переносит журнал в файл, закрывает его и сохраняет поисковый индекс.
+        Вызывается автоматически при выходе.
+        """
+        if self._journal_file is not None:
+            if self._compactor is not None:
+                self._compactor.join()
+            with self._compact_lock, self._lock:
+                if self._journal_records:
+                    self.pushJson()
+                self._journal_file.close()
+                self._journal_file = None
+                os.remove(self.journal_path)
+        if self.search is not None and self.search.dirty:
+            self.search.save()
+        atexit.unregister(self.close)
 
     # Секции
+    @journaled
     def createSection(self, section_name: str, section_id: str):
         if section_id not in self.data:
             self.data[section_id] = {
@@ -51,10 +863,10 @@ class JsonHandler:
                 "id": section_id,
                 "content": {}
             }
-            self.pushJson()
         else:
             raise ValueError(f"Секция с идентификатором {section_id} уже существует.")
 
+    @journaled
     def editSection(self, section_id_to_edit: str, new_section_name: str, new_section_id: str):
         if section_id_to_edit in self.data:
             # Сохраняем данные старой секции
@@ -69,18 +881,18 @@ class JsonHandler:
                 self.data[new_section_id] = section_data
                 del self.data[section_id_to_edit]
             
-            self.pushJson()
         else:
             raise ValueError(f"Секция с идентификатором {section_id_to_edit} не найдена.")
         
+    @journaled
     def deleteSection(self, section_id_to_delete: str):
         if section_id_to_delete in self.data:
             del self.data[section_id_to_delete]
-            self.pushJson()
         else:
             raise ValueError(f"Секция с идентификатором {section_id_to_delete} не найдена.")
     
     # Посты
+    @journaled
     def createPost(self, section_id: str, title: str, post_id: str, explanation: str):
         if title and post_id and explanation:
             if section_id in self.data:
@@ -93,8 +905,6 @@ class JsonHandler:
                     "parameters": [],
                     "code": []
                 }
-                # if not isinstance(self.data[section_id].get("content"), dict)
-                self.pushJson()
             else:
                 raise ValueError(f"Секция с идентификатором {section_id} не найдена.")
         else:
@@ -187,6 +997,7 @@ class JsonHandler:
         
         return '\n'.join(lines)
 
+    @journaled
     def editPost(self, section_id: str, post_id: str, new_title: str, new_id: str, new_explanation: str):
         if post_id in self.data[section_id]["content"]:
             post_data = self.data[section_id]["content"][post_id]
@@ -200,18 +1011,18 @@ class JsonHandler:
                 self.data[section_id]["content"][new_id] = post_data
                 del self.data[section_id]["content"][post_id]
             
-            self.pushJson()
         else:
             raise ValueError(f"Пост с идентификатором {post_id} не найден в секции с идентификатором {section_id}.") 
 
+    @journaled
     def deletePost(self, section_id: str, post_id: str):
         if post_id in self.data[section_id]["content"]:
             del self.data[section_id]["content"][post_id]
-            self.pushJson()
         else:
             raise ValueError(f"Пост с идентификатором {post_id} не найден в секции с идентификатором {section_id}.")
 
     # Параметры
+    @journaled
     def createParameter(self, section_id: str, post_id: str, name: str, description: str):
         if post_id in self.data[section_id]["content"]:
             post_data = self.data[section_id]["content"][post_id]
@@ -224,23 +1035,23 @@ class JsonHandler:
                 "description": description,
             })
             
-            self.pushJson()
         else:
             raise ValueError(f"Пост с идентификатором {post_id} не найден в секции с идентификатором {section_id}.")
         
+    @journaled
     def deleteParameter(self, section_id: str, post_id: str, parameter_index: int):
         if post_id in self.data[section_id]["content"]:
             post_data = self.data[section_id]["content"][post_id]
             
             if isinstance(post_data.get("parameters"), list) and parameter_index < len(post_data["parameters"]):
                 del post_data["parameters"][parameter_index]
-                self.pushJson()
             else:
                 raise IndexError(f"Индекс параметра {parameter_index} не валиден для поста с идентификатором {post_id}.")
         else:
             raise ValueError(f"Пост с идентификатором {post_id} не найден в секции с идентификатором {section_id}.")
 
     # Код
+    @journaled
     def createCode(self, section_id: str, post_id: str, lang: str, code: str):
         if post_id in self.data[section_id]["content"]:
             post_data = self.data[section_id]["content"][post_id]
@@ -253,23 +1064,353 @@ class JsonHandler:
                 "content": code,
             })
             
-            self.pushJson()
         else:
             raise ValueError(f"Пост с идентификатором {post_id} не найден в секции с идентификатором {section_id}.")
         
+    @journaled
     def deleteCode(self, section_id: str, post_id: str, code_index: int):
         if post_id in self.data[section_id]["content"]:
             post_data = self.data[section_id]["content"][post_id]
             
             if isinstance(post_data.get("code"), list) and code_index < len(post_data["code"]):
                 del post_data["code"][code_index]
-                self.pushJson()
             else:
                 raise IndexError(f"Индекс параметра {code_index} не валиден для поста с идентификатором {post_id}.")
         else:
             raise ValueError(f"Пост с идентификатором {post_id} не найден в секции с идентификатором {section_id}.")
 
 
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sections (
+    doc TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    position REAL NOT NULL,
+    extra TEXT,
+    PRIMARY KEY (doc, id)
+);
+CREATE TABLE IF NOT EXISTS posts (
+    doc TEXT NOT NULL,
+    section_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    explanation TEXT NOT NULL,
+    position REAL NOT NULL,
+    extra TEXT,
+    PRIMARY KEY (doc, section_id, id),
+    FOREIGN KEY (doc, section_id) REFERENCES sections (doc, id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+CREATE TABLE IF NOT EXISTS parameters (
+    doc TEXT NOT NULL,
+    section_id TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    position REAL NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    FOREIGN KEY (doc, section_id, post_id) REFERENCES posts (doc, section_id, id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+CREATE TABLE IF NOT EXISTS code (
+    doc TEXT NOT NULL,
+    section_id TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    position REAL NOT NULL,
+    language TEXT NOT NULL,
+    content TEXT NOT NULL,
+    FOREIGN KEY (doc, section_id, post_id) REFERENCES posts (doc, section_id, id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+CREATE INDEX IF NOT EXISTS sections_order ON sections (doc, position);
+CREATE INDEX IF NOT EXISTS posts_order ON posts (doc, section_id, position);
+CREATE INDEX IF NOT EXISTS parameters_post ON parameters (doc, section_id, post_id, position);
+CREATE INDEX IF NOT EXISTS code_post ON code (doc, section_id, post_id, position);
+"""
+
+SECTION_FIELDS = ("id", "name", "content")
+POST_FIELDS = ("id", "title", "explanation", "parameters", "code")
+
+
+def connect_sqlite(db_path: str) -> sqlite3.Connection:
+    """
+    Открывает базу документации (WAL: чтение не блокируется записью).
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SQLITE_SCHEMA)
+    return conn
+
+
+def _extra(item: dict, fields: tuple) -> Optional[str]:
+    """
+    Поля, для которых нет колонок (например, parameters_title), хранятся одной JSON строкой.
+    """
+    extra = {key: value for key, value in item.items() if key not in fields}
+    return json.dumps(extra, ensure_ascii=False) if extra else None
+
+
+def read_sqlite_doc(conn: sqlite3.Connection, doc: str) -> dict:
+    """
+    Собирает документ из базы в том же виде, что и JSON файл (порядок - по position).
+    """
+    data: dict[str, Any] = {}
+    for section_id, name, extra in conn.execute(
+            "SELECT id, name, extra FROM sections WHERE doc = ? ORDER BY position", (doc,)):
+        data[section_id] = {"name": name, "id": section_id, **json.loads(extra or "{}"), "content": {}}
+
+    posts = {}
+    for section_id, post_id, title, explanation, extra in conn.execute(
+            "SELECT section_id, id, title, explanation, extra FROM posts WHERE doc = ? ORDER BY position", (doc,)):
+        post = {"title": title, "id": post_id, "explanation": explanation, **json.loads(extra or "{}"),
+                "parameters": [], "code": []}
+        data[section_id]["content"][post_id] = posts[section_id, post_id] = post
+
+    for section_id, post_id, name, description in conn.execute(
+            "SELECT section_id, post_id, name, description FROM parameters WHERE doc = ? ORDER BY position", (doc,)):
+        posts[section_id, post_id]["parameters"].append({"name": name, "description": description})
+    for section_id, post_id, language, content in conn.execute(
+            "SELECT section_id, post_id, language, content FROM code WHERE doc = ? ORDER BY position", (doc,)):
+        posts[section_id, post_id]["code"].append({"language": language, "content": content})
+    return data
+
+
+def to_site_json(data: dict) -> list[dict]:
+    """
+    Документ в формате сайта (content.js, docs/data.json): список секций
+    {id, name, sections: [посты]}, где sections - посты секции по порядку.
+    """
+    site = []
+    for section_id, section in data.items():
+        fields = {key: value for key, value in section.items() if key not in ("id", "name", "content")}
+        site.append({"id": section.get("id", section_id), "name": section["name"], **fields,
+                     "sections": [{**post, "id": post.get("id", post_id)}
+                                  for post_id, post in section.get("content", {}).items()]})
+    return site
+
+
+def from_site_json(site: list[dict]) -> dict:
+    """
+    Документ в формате сайта (см. to_site_json) в формате редактора: {id секции: {..., content: {id поста: пост}}}.
+    """
+    data = {}
+    for item in site:
+        fields = {key: value for key, value in item.items() if key != "sections"}
+        data[item["id"]] = {**fields, "content": {post["id"]: post for post in item.get("sections", [])}}
+    return data
+
+
+def export_json(db_path: str, doc: str, out_path: str):
+    """
+    Выгружает документ из базы в JSON файл в формате сайта, который читает content.js.
+    """
+    conn = connect_sqlite(db_path)
+    try:
+        text = json.dumps(to_site_json(read_sqlite_doc(conn, doc)), ensure_ascii=False, indent=4)
+    finally:
+        conn.close()
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, out_path)
+    print(f"Выгружено: {out_path}")
+
+
+def import_json(json_path: str, db_path: str, doc: Optional[str] = None):
+    """
+    Загружает JSON файл документации в базу (документ doc, по умолчанию - имя файла).
+    Файл может быть в формате редактора или сайта (выгруженный export_json).
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = from_site_json(data)
+    with SqliteHandler(db_path, doc or os.path.splitext(os.path.basename(json_path))[0]) as handler:
+        handler.data.clear()
+        handler.data.update(data)
+        handler.validate()
+        handler.pushJson()
+    print(f"Загружено: {json_path} -> {db_path}")
+
+
+def list_sqlite_docs(db_path: str) -> list[str]:
+    conn = connect_sqlite(db_path)
+    try:
+        return [doc for doc, in conn.execute("SELECT DISTINCT doc FROM sections ORDER BY doc")]
+    finally:
+        conn.close()
+
+
+class SqliteHandler(JsonHandler):
+    """
+    JsonHandler, который хранит документ в SQLite: секции, посты, параметры
+    и код - отдельные таблицы с колонкой порядка. Документ один раз читается
+    в память (self.data, как у JsonHandler), а каждое изменение - несколько
+    индексированных запросов вместо перезаписи файла. В одной базе может
+    храниться много документов (колонка doc).
+
+    Для сайта документ выгружается в JSON (export_json) при закрытии, если
+    задан export_path. close вызывается и автоматически при выходе.
+    """
+    def __init__(self, db_path: str, doc: str, export_path: Optional[str] = None):
+        # Журнал не нужен: каждое изменение - транзакция SQLite. Поиск индексирует
+        # docs/*.json, в том числе выгруженные из базы
+        self.doc = doc
+        self.export_path = export_path
+        self._changed = False
+        self.conn = connect_sqlite(db_path)  # Нужна loadJson в JsonHandler.__init__
+        super().__init__(db_path, journal=False, name=f"{os.path.basename(db_path)}:{doc}")
+        atexit.register(self.close)
+
+    def loadJson(self):
+        self.data = read_sqlite_doc(self.conn, self.doc)
+
+    def pushJson(self):
+        """
+        Записывает весь документ в базу заново (импорт, восстановление из бэкапа).
+        """
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM sections WHERE doc = ?", (self.doc,))
+            for section_position, (section_id, section) in enumerate(self.data.items()):
+                self.conn.execute("INSERT INTO sections VALUES (?, ?, ?, ?, ?)", (
+                    self.doc, section_id, section["name"], section_position, _extra(section, SECTION_FIELDS)))
+                for post_position, (post_id, post) in enumerate(section["content"].items()):
+                    self.conn.execute("INSERT INTO posts VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                        self.doc, section_id, post_id, post["title"], post["explanation"], post_position,
+                        _extra(post, POST_FIELDS)))
+                    self.conn.executemany("INSERT INTO parameters VALUES (?, ?, ?, ?, ?, ?)", [
+                        (self.doc, section_id, post_id, index, item["name"], item["description"])
+                        for index, item in enumerate(post.get("parameters", []))])
+                    self.conn.executemany("INSERT INTO code VALUES (?, ?, ?, ?, ?, ?)", [
+                        (self.doc, section_id, post_id, index, item["language"], item["content"])
+                        for index, item in enumerate(post.get("code", []))])
+        self._changed = True
+
+    def _mutation(self):
+        """
+        Изменение в памяти происходит до запросов к базе, поэтому даже одно
+        изменение идёт через transaction: если запрос упадёт, self.data
+        откатится к снимку и не разойдётся с базой.
+        """
+        return self.transaction()
+
+    def _commit(self, records: list[dict]):
+        with self.conn:
+            for record in records:
+                getattr(self, f"_sql_{record['op']}")(*record["args"], **record["kwargs"])
+        self._changed = True
+
+    def close(self):
+        """
+        Сохраняет снимок в бэкапы, выгружает JSON для сайта и закрывает базу.
+        """
+        if self.conn is None:
+            return
+        if self._changed:
+            self._backup()
+            if self.export_path:
+                export_json(self.path, self.doc, self.export_path)
+        self.conn.close()
+        self.conn = None
+        atexit.unregister(self.close)
+
+    # Запросы для изменений JsonHandler (аргументы те же)
+    def _next_position(self, table: str, where: str, params: tuple) -> float:
+        row = self.conn.execute(f"SELECT MAX(position) FROM {table} WHERE {where}", params).fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def _sql_createSection(self, section_name: str, section_id: str):
+        self.conn.execute("INSERT INTO sections VALUES (?, ?, ?, ?, NULL)", (
+            self.doc, section_id, section_name, self._next_position("sections", "doc = ?", (self.doc,))))
+
+    def _sql_editSection(self, section_id_to_edit: str, new_section_name: str, new_section_id: str):
+        # Как и в словаре: секция встаёт на место уже существующей с новым id или в конец
+        position = None
+        if section_id_to_edit != new_section_id:
+            row = self.conn.execute("SELECT position FROM sections WHERE doc = ? AND id = ?",
+                                    (self.doc, new_section_id)).fetchone()
+            if row:
+                self.conn.execute("DELETE FROM sections WHERE doc = ? AND id = ?", (self.doc, new_section_id))
+                position = row[0]
+            else:
+                position = self._next_position("sections", "doc = ?", (self.doc,))
+        self.conn.execute(
+            "UPDATE sections SET name = ?, id = ?, position = COALESCE(?, position) WHERE doc = ? AND id = ?",
+            (new_section_name, new_section_id, position, self.doc, section_id_to_edit))
+
+    def _sql_deleteSection(self, section_id_to_delete: str):
+        self.conn.execute("DELETE FROM sections WHERE doc = ? AND id = ?", (self.doc, section_id_to_delete))
+
+    def _sql_createPost(self, section_id: str, title: str, post_id: str, explanation: str):
+        key = (self.doc, section_id, post_id)
+        updated = self.conn.execute(
+            "UPDATE posts SET title = ?, explanation = ?, extra = NULL WHERE doc = ? AND section_id = ? AND id = ?",
+            (title, explanation, *key)).rowcount
+        if updated:
+            self.conn.execute("DELETE FROM parameters WHERE doc = ? AND section_id = ? AND post_id = ?", key)
+            self.conn.execute("DELETE FROM code WHERE doc = ? AND section_id = ? AND post_id = ?", key)
+        else:
+            position = self._next_position("posts", "doc = ? AND section_id = ?", key[:2])
+            self.conn.execute("INSERT INTO posts VALUES (?, ?, ?, ?, ?, ?, NULL)", (*key, title, explanation, position))
+
+    def _sql_editPost(self, section_id: str, post_id: str, new_title: str, new_id: str, new_explanation: str):
+        position = None
+        if post_id != new_id:
+            row = self.conn.execute("SELECT position FROM posts WHERE doc = ? AND section_id = ? AND id = ?",
+                                    (self.doc, section_id, new_id)).fetchone()
+            if row:
+                self.conn.execute("DELETE FROM posts WHERE doc = ? AND section_id = ? AND id = ?",
+                                  (self.doc, section_id, new_id))
+                position = row[0]
+            else:
+                position = self._next_position("posts", "doc = ? AND section_id = ?", (self.doc, section_id))
+        self.conn.execute(
+            "UPDATE posts SET title = ?, id = ?, explanation = ?, position = COALESCE(?, position) "
+            "WHERE doc = ? AND section_id = ? AND id = ?",
+            (new_title, new_id, new_explanation, position, self.doc, section_id, post_id))
+
+    def _sql_deletePost(self, section_id: str, post_id: str):
+        self.conn.execute("DELETE FROM posts WHERE doc = ? AND section_id = ? AND id = ?", (self.doc, section_id, post_id))
+
+    def _sql_createItem(self, table: str, section_id: str, post_id: str, first: str, second: str):
+        key = (self.doc, section_id, post_id)
+        position = self._next_position(table, "doc = ? AND section_id = ? AND post_id = ?", key)
+        self.conn.execute(f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?)", (*key, position, first, second))
+
+    def _sql_deleteItem(self, table: str, section_id: str, post_id: str, index: int):
+        self.conn.execute(
+            f"DELETE FROM {table} WHERE rowid = (SELECT rowid FROM {table} "
+            f"WHERE doc = ? AND section_id = ? AND post_id = ? ORDER BY position LIMIT 1 OFFSET ?)",
+            (self.doc, section_id, post_id, index))
+
+    def _sql_createParameter(self, section_id: str, post_id: str, name: str, description: str):
+        self._sql_createItem("parameters", section_id, post_id, name, description)
+
+    def _sql_deleteParameter(self, section_id: str, post_id: str, parameter_index: int):
+        self._sql_deleteItem("parameters", section_id, post_id, parameter_index)
+
+    def _sql_createCode(self, section_id: str, post_id: str, lang: str, code: str):
+        self._sql_createItem("code", section_id, post_id, lang, code)
+
+    def _sql_deleteCode(self, section_id: str, post_id: str, code_index: int):
+        self._sql_deleteItem("code", section_id, post_id, code_index)
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _fsync_dir(path: str):
+    """
+    Сбрасывает на диск запись каталога после os.replace (на Windows не нужно и невозможно).
+    """
+    if os.name == "nt":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
 def format_two_columns(left_text: str, right_text: str, total_width: int = 78, padding: int = 4):
     """
     Форматирует два текста в одной строке с выравниванием по краям
@@ -466,12 +1607,19 @@ def max_str_len(text: str, long: int) -> str:
 
 
 def main(path: str):
-    data = JsonHandler(path)
+    # База SQLite открывается как "docs/файл.sqlite:документ", JSON для сайта - docs/документ.json
+    if ":" in os.path.basename(path):
+        db_path, doc = path.rsplit(":", 1)
+        data = SqliteHandler(db_path, doc, export_path=os.path.join(os.path.dirname(db_path), f"{doc}.json"))
+    else:
+        search = SearchIndex(os.path.dirname(path))
+        search.sync()
+        data = JsonHandler(path, search=search)
 
     while True:
         clearConsole()
         section_list = [[data[key]['name'], data[key]['id']] for key in data.data.keys()]
-        choosed_section = choose_option([["Добавить секцию", ""]] + section_list, "Выберите секцию:")
+        choosed_section = choose_option([["Добавить секцию", ""], ["Восстановить версию", ""]] + section_list, "Выберите секцию:")
 
         if choosed_section in (-1, 0):
             break
@@ -486,9 +1634,17 @@ def main(path: str):
                     break
                 except ValueError as e:
                     print(e)
+        # Восстановить версию из бэкапа
+        elif choosed_section == 2:
+            clearConsole()
+            snapshots = data.backups.snapshots(data.name)[:30]
+            snapshot_list = [[f"{datetime.fromtimestamp(entry['time']):%Y-%m-%d %H:%M:%S}", f"постов: {entry['posts']}"] for entry in snapshots]
+            choosed_snapshot = choose_option(snapshot_list, "Выберите версию:") if snapshots else -1
+            if choosed_snapshot > 0:
+                data.restore(snapshots[choosed_snapshot - 1]["time"])
         # Выбор секции
         else:
-            section_id = section_list[choosed_section - 2][1]
+            section_id = section_list[choosed_section - 3][1]
             section_data = data[section_id]
             while True:
                 clearConsole()
@@ -573,15 +1729,12 @@ def main(path: str):
                                             if not param_name or not param_content:
                                                 continue
                                             data.createParameter(section_id, post_id, param_name, param_content)
-                                            if {"name": param_name, "description": param_content} not in parameters:
-                                                parameters.append({"name": param_name, "description": param_content})  # Добавление в локальный список
                                         # Удалить
                                         else:
                                             clearConsole()
                                             is_confirmed = choose_option(["Да", "Нет"], f"Удалить параметр {parameters[choosed_paremeter - 2]["name"]}?")
                                             if is_confirmed == 1:
                                                 data.deleteParameter(section_id, post_id, (choosed_paremeter - 2))
-                                                del parameters[(choosed_paremeter - 2)]
                                 # Код поста
                                 elif action == 4:
                                     while True:
@@ -599,15 +1752,12 @@ def main(path: str):
                                             if not code_name or not code_content:
                                                 continue
                                             data.createCode(section_id, post_id, code_name, code_content)
-                                            if {"language": code_name, "content": code_content} not in codes:
-                                                codes.append({"language": code_name, "content": code_content})  # Добавление в локальный список
                                         # Удалить
                                         else:
                                             clearConsole()
                                             is_confirmed = choose_option(["Да", "Нет"], f"Удалить код {codes[choosed_code - 2]["language"]}?")
                                             if is_confirmed == 1:
                                                 data.deleteCode(section_id, post_id, (choosed_code - 2))
-                                                del codes[(choosed_code - 2)]  # Удаление из локального списка
                                 # Удалить пост
                                 elif action == 5:
                                     clearConsole()
@@ -617,10 +1767,35 @@ def main(path: str):
                                         section_data = data[section_id]
                                         break
 
+    data.close()  # Журнал - в файл; для базы - бэкап и выгрузка JSON для сайта
+
 
 if __name__ == "__main__":
-    docs = os.listdir(path="docs")
-    del docs[docs.index("backups")]
+    # python edit.py import docs/css.json docs/docs.sqlite  |  python edit.py export docs/docs.sqlite css docs/css.json
+    if sys.argv[1:2] == ["import"]:
+        import_json(*sys.argv[2:5])
+        sys.exit()
+    if sys.argv[1:2] == ["export"]:
+        export_json(*sys.argv[2:5])
+        sys.exit()
+    # python edit.py search "запрос"  |  python edit.py reindex
+    if sys.argv[1:2] in (["search"], ["reindex"]):
+        index = SearchIndex("docs")
+        if sys.argv[1] == "reindex":
+            index.files.clear()
+        print(f"Переиндексировано файлов: {index.sync()}")
+        if sys.argv[1] == "search":
+            start = time.perf_counter()
+            results = index.search(" ".join(sys.argv[2:]))
+            for result in results:
+                print(f"{result['score']:8.2f}  {result['file']}  {result['section']}/{result['post']}  {result['title']}")
+            print(f"Найдено: {len(results)} за {(time.perf_counter() - start) * 1000:.1f} мс")
+        sys.exit()
+
+    docs = sorted(name for name in os.listdir(path="docs") if name.endswith(".json"))
+    for name in sorted(os.listdir(path="docs")):
+        if name.endswith(".sqlite"):
+            docs += [f"{name}:{doc}" for doc in list_sqlite_docs(os.path.join("docs", name))]
     choosed_file_index = choose_option(["Создать новый файл"] + docs, "Выберите файл:")
     
     if choosed_file_index == 1:  # "Создать новый файл"
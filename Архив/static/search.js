@@ -0,0 +1,114 @@
+// Поиск по индексу docs/search/index.json (его собирает static/edit.py: python edit.py reindex)
+// Токенизация и стемминг повторяют SearchIndex из edit.py, иначе термы запроса не совпадут с индексом
+
+const RU_ENDINGS = [
+    'иями', 'ями', 'ия', 'ию', 'ии', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией', 'иях',
+    'ах', 'ях', 'ам', 'ям', 'ом', 'ем', 'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ую', 'юю', 'ов', 'ев', 'ть', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь',
+];
+const EN_ENDINGS = ['ing', 'ed', 'es', 's'];
+
+let index = null;
+let vocabulary = null;
+
+function stem(word) {
+    const endings = /[а-я]/.test(word) ? RU_ENDINGS : EN_ENDINGS;
+    for (const ending of endings) {
+        if (word.endsWith(ending) && word.length - ending.length >= 3) {
+            return word.slice(0, -ending.length);
+        }
+    }
+    return word;
+}
+
+export function tokenize(text) {
+    const words = text.toLowerCase().replaceAll('ё', 'е').match(/[\p{L}\p{N}]+/gu) || [];
+    return words.filter(word => word.length > 1).map(stem);
+}
+
+async function loadIndex() {
+    if (!index) {
+        const response = await fetch('/docs/search/index.json');
+        index = await response.json();
+        vocabulary = Object.keys(index.terms).sort();
+    }
+    return index;
+}
+
+// Первый номер в отсортированном словаре, где терм не меньше value
+function lowerBound(value) {
+    let low = 0, high = vocabulary.length;
+    while (low < high) {
+        const middle = (low + high) >> 1;
+        if (vocabulary[middle] < value) low = middle + 1; else high = middle;
+    }
+    return low;
+}
+
+// Расстояние Левенштейна; как только оно заведомо больше limit, возвращает limit + 1
+function editDistance(a, b, limit) {
+    let previous = Array.from({ length: b.length + 1 }, (_, j) => j);
+    for (let i = 1; i <= a.length; i++) {
+        const current = [i];
+        for (let j = 1; j <= b.length; j++) {
+            current.push(Math.min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] !== b[j - 1])));
+        }
+        if (Math.min(...current) > limit) return limit + 1;
+        previous = current;
+    }
+    return previous[b.length];
+}
+
+// Термы словаря для терма запроса с множителем: точное совпадение 1, продолжение (префикс) 0.6,
+// опечатка 0.4 - только если нет первых двух (как SearchIndex._expand в edit.py)
+function expand(term) {
+    const matches = [];
+    for (let i = lowerBound(term); i < vocabulary.length && matches.length < 51 && vocabulary[i].startsWith(term); i++) {
+        matches.push([vocabulary[i], vocabulary[i] === term ? 1 : 0.6]);
+    }
+    if (matches.length) return matches;
+
+    const limit = term.length <= 5 ? 1 : 2;
+    const end = lowerBound(String.fromCharCode(term.charCodeAt(0) + 1));
+    for (let i = lowerBound(term[0]); i < end; i++) {
+        const candidate = vocabulary[i];
+        if (Math.abs(candidate.length - term.length) <= limit && editDistance(term, candidate, limit) <= limit) {
+            matches.push([candidate, 0.4]);
+        }
+    }
+    return matches;
+}
+
+// Посты, содержащие все слова запроса: [{file, section, post, title, score}] по убыванию score
+export async function search(query, limit = 10) {
+    const { docs, terms } = await loadIndex();
+    let scores = null;
+    for (const term of new Set(tokenize(query))) {
+        const matches = new Map();
+        for (const [candidate, factor] of expand(term)) {
+            const postings = terms[candidate];
+            const idf = Math.log(1 + docs.length / (postings.length / 2));
+            for (let i = 0; i < postings.length; i += 2) {
+                const score = postings[i + 1] * factor * idf;
+                if (score > (matches.get(postings[i]) || 0)) matches.set(postings[i], score);
+            }
+        }
+        if (scores === null) {
+            scores = matches;
+        } else {
+            for (const [number, score] of scores) {
+                if (matches.has(number)) scores.set(number, score + matches.get(number));
+                else scores.delete(number);
+            }
+        }
+        if (scores.size === 0) return [];
+    }
+
+    return [...(scores || [])]
+        .sort((a, b) => b[1] - a[1])
+        .slice(0, limit)
+        .map(([number, score]) => {
+            const [file, section, post, title] = docs[number];
+            return { file, section, post, title, score };
+        });
+}